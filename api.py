@@ -1,35 +1,55 @@
+import asyncio
+import json
+from typing import List
 from fastapi import FastAPI, HTTPException, Header
-import requests
-from spotify import get_track_info
-from yt_download_api import get_download_url
-import base64
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from spotify import get_track_info_async, get_tracks_info_async, is_valid_spotify_id
+from projection import get_payload_stats
+from rate_limit import get_scheduler
+from response_cache import get_response_cache
+from search_cache import get_search_cache
+from spotify_client import close_async_client, get_async_client, get_client
+from job_queue import get_job_queue
+from download_worker import ensure_worker_running
+from yt_download import preflight
+from single_flight import coalescing_stats, get_flight
+from token_cache import get_cached_token_async, hash_secret
+from track_matcher import get_match_stats
+from yt_download_api import get_download_url_async, get_url_cache
 
 app = FastAPI(title="Spotify Downloader API", version="1.0.0")
 
+MAX_BATCH_TRACKS = 500
+
+class TracksRequest(BaseModel):
+    ids: List[str]
+
 async def get_spotify_token(credentials: dict) -> str:
-    """Get Spotify access token from credentials"""
+    """Get Spotify access token from credentials, reusing a cached token while it is valid"""
+    # Key on a hash so the secret isn't held as plain text
+    key = (credentials['client_id'], hash_secret(credentials['client_secret']))
     try:
-        # Encode client credentials
-        auth_header = base64.b64encode(
-            f"{credentials['client_id']}:{credentials['client_secret']}".encode('utf-8')
-        ).decode('utf-8')
-        
-        # Get token
-        response = requests.post(
-            'https://accounts.spotify.com/api/token',
-            headers={
-                'Authorization': f'Basic {auth_header}',
-                'Content-Type': 'application/x-www-form-urlencoded'
-            },
-            data={'grant_type': 'client_credentials'}
+        access_token, error = await get_flight('token').run(
+            key, get_cached_token_async, credentials['client_id'], credentials['client_secret']
         )
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=401, detail="Invalid Spotify credentials")
-            
-        return response.json()['access_token']
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting Spotify token: {str(e)}")
+    
+    if not access_token:
+        raise HTTPException(status_code=401, detail=error)
+        
+    return access_token
+
+async def resolve_download_url(track_info):
+    """Get the download URL of a track, sharing one yt-dlp lookup between concurrent requests for it"""
+    if not track_info.id:
+        return await get_download_url_async(track_info)
+    return await get_flight('url').run(track_info.id, get_download_url_async, track_info)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_async_client()
 
 @app.get("/v1/track/{track_id}")
 async def get_track_download_url(
@@ -42,28 +62,175 @@ async def get_track_download_url(
     - Requires Spotify client_id and client_secret in headers
     - Returns track info and download URL
     """
+    if not is_valid_spotify_id(track_id):
+        raise HTTPException(status_code=400, detail="Invalid track id")
     try:
         # Get access token
         access_token = await get_spotify_token({"client_id": client_id, "client_secret": client_secret})
         
-        # Get track info
-        track_info, error = get_track_info(access_token, track_id)
+        # Get track info; concurrent requests for the same track share one Spotify call
+        track_info, error = await get_flight('metadata').run(track_id, get_track_info_async, access_token, track_id)
         if error:
             raise HTTPException(status_code=404, detail=error)
         
         # Get download URL
-        download_url = get_download_url(track_info)
+        download_url = await resolve_download_url(track_info)
         if not download_url:
             raise HTTPException(status_code=404, detail="Could not find download URL")
         
         return {
             "status": "success",
-            "track_info": track_info,
+            "track_info": track_info.to_dict(),
             "download_url": download_url
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/v1/tracks")
+async def get_tracks_download_urls(
+    request: TracksRequest,
+    client_id: str = Header(...),
+    client_secret: str = Header(...)
+):
+    """
+    Get direct download URLs for many Spotify tracks
+    - Requires Spotify client_id and client_secret in headers
+    - Body: {"ids": [...]} with up to 500 track ids
+    - Streams one NDJSON line per track as soon as its download URL is resolved
+    """
+    track_ids = list(dict.fromkeys(request.ids))
+    if not track_ids:
+        raise HTTPException(status_code=400, detail="No track ids given")
+    if len(track_ids) > MAX_BATCH_TRACKS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_TRACKS} track ids per request")
+
+    access_token = await get_spotify_token({"client_id": client_id, "client_secret": client_secret})
+
+    async def resolve(track_id, track_info):
+        if not is_valid_spotify_id(track_id):
+            return {"status": "error", "track_id": track_id, "detail": "Invalid track id"}
+        if not track_info:
+            return {"status": "error", "track_id": track_id, "detail": "Track not found"}
+        download_url = await resolve_download_url(track_info)
+        if not download_url:
+            return {"status": "error", "track_id": track_id, "track_info": track_info.to_dict(),
+                    "detail": "Could not find download URL"}
+        return {"status": "success", "track_id": track_id, "track_info": track_info.to_dict(),
+                "download_url": download_url}
+
+    async def stream_results():
+        tracks_info, error = await get_tracks_info_async(access_token, track_ids)
+        if error:
+            yield json.dumps({"status": "error", "detail": error}) + "\n"
+            return
+        pending = [resolve(track_id, tracks_info.get(track_id)) for track_id in track_ids]
+        for next_result in asyncio.as_completed(pending):
+            yield json.dumps(await next_result) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.post("/v1/downloads")
+async def queue_downloads(
+    request: TracksRequest,
+    client_id: str = Header(...),
+    client_secret: str = Header(...)
+):
+    """
+    Queue tracks to be downloaded on the server by the background worker
+    - Requires Spotify client_id and client_secret in headers
+    - Body: {"ids": [...]} with up to 500 track ids
+    - Returns a batch id to poll with GET /v1/downloads/{batch_id}
+    """
+    track_ids = list(dict.fromkeys(request.ids))
+    if not track_ids:
+        raise HTTPException(status_code=400, detail="No track ids given")
+    if len(track_ids) > MAX_BATCH_TRACKS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_TRACKS} track ids per request")
+
+    access_token = await get_spotify_token({"client_id": client_id, "client_secret": client_secret})
+    tracks_info, error = await get_tracks_info_async(access_token, track_ids)
+    if error:
+        raise HTTPException(status_code=502, detail=error)
+
+    found = [tracks_info[track_id] for track_id in track_ids if track_id in tracks_info]
+    downloaded, pending = await asyncio.to_thread(preflight, found)
+    batch_id, job_ids = None, []
+    if pending:
+        batch_id, job_ids = await asyncio.to_thread(get_job_queue().enqueue_many, pending)
+        await asyncio.to_thread(ensure_worker_running)
+    return {
+        "status": "queued",
+        "batch_id": batch_id,
+        "jobs": [{"job_id": job_id, "track_id": track.id} for job_id, track in zip(job_ids, pending)],
+        "already_downloaded": [track.id for track, _ in downloaded],
+        "not_found": [track_id for track_id in track_ids
+                      if is_valid_spotify_id(track_id) and track_id not in tracks_info],
+        "invalid": [track_id for track_id in track_ids if not is_valid_spotify_id(track_id)]
+    }
+
+def blocking_stats():
+    """Stats whose getters may open a SQLite database on first use"""
+    return {
+        "response_cache": get_response_cache().stats(),
+        "search_cache": get_search_cache().stats(),
+        "workers": get_job_queue().worker_stats()
+    }
+
+@app.get("/v1/stats")
+async def get_stats():
+    """
+    Get cache, request coalescing, rate limiting and matching statistics of this API process
+    - Returns hit/miss counts of the stream URL, Spotify response and search caches
+    - Returns, per stage, how many requests joined an identical lookup already in flight
+    - Returns how often requests were throttled and how long they waited for the rate limit
+    - Returns request and connection counts of the Spotify clients
+    - Returns, per projection, the bytes received and the bytes compression and projection saved
+    - Returns how often the first search hit was rejected by the track matcher
+    - Returns the counters each live download worker published with its last heartbeat
+    """
+    stats = await asyncio.to_thread(blocking_stats)
+    return {
+        "url_cache": get_url_cache().stats(),
+        "response_cache": stats["response_cache"],
+        "search_cache": stats["search_cache"],
+        "coalescing": coalescing_stats(),
+        "rate_limit": get_scheduler().stats(),
+        "payloads": get_payload_stats().summary(),
+        "connections": {
+            "sync": get_client().connection_stats(),
+            "async": get_async_client().connection_stats()
+        },
+        "matching": get_match_stats().stats(),
+        "workers": stats["workers"]
+    }
+
+@app.get("/v1/downloads/{batch_id}")
+async def get_download_status(batch_id: str):
+    """
+    Get the status of a queued download batch
+    - Returns per-state counts and the state, attempts and error of every job
+    """
+    jobs = await asyncio.to_thread(get_job_queue().get_batch, batch_id)
+    if not jobs:
+        raise HTTPException(status_code=404, detail="Unknown batch id")
+    counts = {}
+    for job in jobs:
+        counts[job['state']] = counts.get(job['state'], 0) + 1
+    return {
+        "batch_id": batch_id,
+        "counts": counts,
+        "jobs": [{
+            "job_id": job['id'],
+            "track_id": job['track_id'],
+            "name": job['track_info']['name'],
+            "state": job['state'],
+            "attempts": job['attempts'],
+            "error": job['error']
+        } for job in jobs]
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
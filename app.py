@@ -11,9 +11,14 @@ from spotify import (
     get_access_token, extract_spotify_id, get_track_info,
     get_album_info, get_playlist_info, format_duration, format_date
 )
-from yt_download import download_track, download_tracks, get_downloaded_tracks
+from yt_download import find_downloaded, get_downloaded_tracks, preflight
+from bandwidth import bandwidth_summary
+from job_queue import get_job_queue
+from retry_policy import retry_summary
+from transcoder import stage_summary
+from download_worker import ensure_worker_running
 from user_stats import display_user_stats
-import os
+import mimetypes
 
 # Custom CSS for better styling
 st.markdown("""
@@ -78,13 +83,46 @@ def display_audio_features(features):
         st.warning("Could not display audio features")
 
 def handle_download(track_info):
-    """Handle the download of a single track"""
-    with st.spinner(f"Downloading {track_info['name']}..."):
-        file_path = download_track(track_info)
-        if file_path and os.path.exists(file_path):
-            st.success("Download completed!")
-            return True
-    return False
+    """Queue the download of a single track for the background worker"""
+    if find_downloaded(track_info):
+        st.info(f"{track_info['name']} is already downloaded.")
+        return True
+    get_job_queue().enqueue(track_info)
+    ensure_worker_running()
+    st.success(f"Queued {track_info['name']} for download. Track progress in the Downloaded Songs tab.")
+    return True
+
+def handle_download_all(info):
+    """Queue every track of an album or playlist that isn't downloaded yet"""
+    downloaded, pending = preflight(info['tracks'])
+    if pending:
+        get_job_queue().enqueue_many(pending, label=info['name'])
+        ensure_worker_running()
+    st.success(f"Queued {len(pending)} new tracks for download, skipped {len(downloaded)} already downloaded. "
+               "Track progress in the Downloaded Songs tab.")
+
+def display_download_jobs():
+    """Display the status of recently queued downloads"""
+    batches = get_job_queue().recent_batches()
+    if not batches:
+        return
+    
+    st.subheader("Download Queue")
+    if st.button("🔄 Refresh"):
+        st.rerun()
+    for batch in batches:
+        finished = batch['done'] + batch['failed']
+        st.write(f"**{batch['label']}**: {batch['done']} done, {batch['running']} running, "
+                 f"{batch['queued']} queued, {batch['failed']} failed")
+        st.progress(finished / batch['total'])
+    for worker, stats in get_job_queue().worker_stats().items():
+        if 'bandwidth' in stats:
+            st.caption(f"Worker {worker} bandwidth: {bandwidth_summary(stats['bandwidth'])}")
+        if 'stages' in stats:
+            st.caption(f"Worker {worker} time per stage: {stage_summary(stats['stages'])}")
+        if 'retries' in stats:
+            st.caption(f"Worker {worker} retries by error class: {retry_summary(stats['retries'])}")
+    st.markdown("---")
 
 def display_track(track, index=None):
     with st.container():
@@ -125,6 +163,8 @@ def display_downloaded_tracks():
     """Display the downloaded tracks page"""
     st.title("📥 Downloaded Songs")
     
+    display_download_jobs()
+    
     tracks = get_downloaded_tracks()
     if not tracks:
         st.info("No downloaded songs yet. Download some songs first!")
@@ -160,12 +200,16 @@ def display_downloaded_tracks():
                     
                     # Audio player
                     with cols[2]:
-                        if os.path.exists(track['file_path']):
-                            try:
-                                with open(track['file_path'], 'rb') as audio_file:
-                                    st.audio(audio_file.read(), format='audio/mp3')
-                            except Exception as e:
-                                st.error(f"Error playing audio: {str(e)}")
+                        try:
+                            with open(track['file_path'], 'rb') as audio_file:
+                                # The extension depends on TRANSCODE_CODEC
+                                audio_format = mimetypes.guess_type(track['file_path'])[0] or 'audio/mp3'
+                                st.audio(audio_file.read(), format=audio_format)
+                        except FileNotFoundError:
+                            # Removed since the last library reconcile
+                            pass
+                        except Exception as e:
+                            st.error(f"Error playing audio: {str(e)}")
                     
                 st.markdown("---")
 
@@ -250,10 +294,7 @@ def main():
                         st.write(f"🎵 Tracks: {info['total_tracks']}")
                         
                         if st.button("⬇️ Download All"):
-                            with st.spinner("Downloading all tracks..."):
-                                results = download_tracks(info['tracks'])
-                                success = sum(1 for r in results if r[0])
-                                st.success(f"Successfully downloaded {success} out of {len(results)} tracks")
+                            handle_download_all(info)
                     
                     st.subheader("Tracks")
                     for track in info['tracks']:
@@ -276,10 +317,7 @@ def main():
                         st.write(f"🎵 Total tracks: {info['total_tracks']}")
                         
                         if st.button("⬇️ Download All"):
-                            with st.spinner("Downloading all tracks..."):
-                                results = download_tracks(info['tracks'])
-                                success = sum(1 for r in results if r[0])
-                                st.success(f"Successfully downloaded {success} out of {len(results)} tracks")
+                            handle_download_all(info)
                     
                     st.subheader("Tracks")
                     for i, track in enumerate(info['tracks'], 1):
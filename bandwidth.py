@@ -0,0 +1,130 @@
+import collections
+import os
+import re
+import threading
+import time
+from decouple import config
+
+def parse_rate(value):
+    """Parse a byte rate such as 500000, '500K' or '2M' into bytes per second; 0 means unlimited"""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kKmMgG]?)i?[bB]?\s*', str(value))
+    if not match:
+        raise ValueError(f"Invalid byte rate {value!r}")
+    number, unit = match.groups()
+    return int(float(number) * {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}[unit.lower()])
+
+def format_rate(bytes_per_second):
+    if bytes_per_second >= 1024 ** 2:
+        return f"{bytes_per_second / 1024 ** 2:.1f} MB/s"
+    return f"{bytes_per_second / 1024:.0f} KB/s"
+
+DOWNLOAD_BANDWIDTH_LIMIT = config('DOWNLOAD_BANDWIDTH_LIMIT', default='0', cast=parse_rate)
+DOWNLOAD_FRAGMENT_CONCURRENCY = config('DOWNLOAD_FRAGMENT_CONCURRENCY', default=4, cast=int)
+THROUGHPUT_WINDOW = 10.0
+
+class BandwidthLimiter:
+    """Byte-rate cap shared by every download in the process.
+
+    Downloads report the bytes they receive through yt-dlp progress hooks, and
+    the hook sleeps until the shared bucket has room for them. yt-dlp calls
+    hooks on the thread that downloads, so sleeping there slows that download
+    down. The limiter also tracks throughput over the last few seconds and the
+    progress of each active download.
+    """
+
+    def __init__(self, rate=DOWNLOAD_BANDWIDTH_LIMIT, window=THROUGHPUT_WINDOW):
+        self.rate = rate
+        self.window = window
+        self._lock = threading.Lock()
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._samples = collections.deque()
+        self._active = {}
+        self._baselines = {}
+        self._stats = {'bytes': 0, 'resumed_bytes': 0, 'throttled_time': 0.0, 'downloads': 0}
+
+    def reserve(self, nbytes):
+        """Account for `nbytes` received and return how many seconds to wait before reading more"""
+        with self._lock:
+            now = time.monotonic()
+            self._samples.append((now, nbytes))
+            while self._samples and self._samples[0][0] < now - self.window:
+                self._samples.popleft()
+            self._stats['bytes'] += nbytes
+            if not self.rate:
+                return 0.0
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= nbytes
+            delay = max(0.0, -self._tokens / self.rate)
+            self._stats['throttled_time'] += delay
+            return delay
+
+    def consume(self, nbytes):
+        delay = self.reserve(nbytes)
+        if delay > 0:
+            time.sleep(delay)
+
+    def expect_resume(self, sizes):
+        """Record {path: size} of partial files, taken before a download attempt continues them"""
+        with self._lock:
+            self._baselines.update(sizes)
+
+    def progress_hook(self, status):
+        """yt-dlp progress hook; register it in the options of every download"""
+        key = status.get('tmpfilename') or status.get('filename')
+        downloaded = status.get('downloaded_bytes') or 0
+        if status.get('status') == 'downloading':
+            with self._lock:
+                previous = self._active.get(key)
+                if previous is None:
+                    self._stats['downloads'] += 1
+                    # Only the size the partial file had before this attempt was fetched earlier;
+                    # everything past it arrived in this attempt's first chunk
+                    baseline = min(downloaded, self._baselines.pop(os.path.abspath(key), 0) if key else 0)
+                    self._stats['resumed_bytes'] += baseline
+                else:
+                    baseline = previous['downloaded']
+                self._active[key] = {
+                    'downloaded': downloaded,
+                    'total': status.get('total_bytes') or status.get('total_bytes_estimate'),
+                    'speed': status.get('speed')
+                }
+            self.consume(max(0, downloaded - baseline))
+        else:
+            with self._lock:
+                self._active.pop(key, None)
+                if key:
+                    self._baselines.pop(os.path.abspath(key), None)
+
+    def throughput(self):
+        """Bytes per second received over the last `window` seconds"""
+        with self._lock:
+            now = time.monotonic()
+            recent = [nbytes for at, nbytes in self._samples if at >= now - self.window]
+        return sum(recent) / self.window
+
+    def stats(self):
+        throughput = self.throughput()
+        with self._lock:
+            stats = dict(self._stats)
+            stats['active'] = {key: dict(value) for key, value in self._active.items()}
+        stats['throughput'] = throughput
+        stats['limit'] = self.rate
+        return stats
+
+    def summary(self):
+        return bandwidth_summary(self.stats())
+
+def bandwidth_summary(stats):
+    """One-line summary of `BandwidthLimiter.stats()`, also of stats published by another process"""
+    limit = format_rate(stats['limit']) if stats['limit'] else "unlimited"
+    return (f"{format_rate(stats['throughput'])} now, {stats['bytes'] / 1024 ** 2:.1f} MB total, "
+            f"{stats['resumed_bytes'] / 1024 ** 2:.1f} MB resumed, "
+            f"{len(stats['active'])} active, throttled {stats['throttled_time']:.1f}s (limit {limit})")
+
+_limiter = BandwidthLimiter()
+
+def get_bandwidth_limiter():
+    """Get the process-wide limiter shared by all download workers"""
+    return _limiter
@@ -0,0 +1,321 @@
+"""Offline benchmarks against fake Spotify/yt-dlp backends.
+
+Run with `python benchmarks.py <name>`, or without a name to run them all.
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import orjson
+
+import spotify
+import track_matcher
+import yt_download
+from bandwidth import BandwidthLimiter, format_rate, parse_rate
+from search_cache import SearchCache, get_search_cache
+from transcoder import Transcoder, get_transcoder
+from ydl_pool import YoutubeDLPool
+
+REAL_YOUTUBEDL = yt_download.yt_dlp.YoutubeDL
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self._data = data
+        self.status_code = status_code
+
+    def json(self):
+        return self._data
+
+    @property
+    def content(self):
+        return orjson.dumps(self._data)
+
+class FakePagedClient:
+    """Serves a playlist of `total` tracks in pages, sleeping `latency` seconds per call"""
+
+    def __init__(self, total, limit=100, latency=0.05):
+        self.total = total
+        self.limit = limit
+        self.latency = latency
+        self.calls = 0
+
+    def page(self, offset, limit):
+        items = [{'track': {
+            'id': f"track{i:018d}",
+            'name': f"Track {i}",
+            'duration_ms': 200000,
+            'album': {'name': 'Album', 'images': []},
+            'artists': [{'name': 'Artist', 'id': 'artist'}],
+            'preview_url': None
+        }} for i in range(offset, min(offset + limit, self.total))]
+        next_offset = offset + limit
+        return {
+            'items': items,
+            'total': self.total,
+            'limit': limit,
+            'offset': offset,
+            'next': f"tracks?offset={next_offset}&limit={limit}" if next_offset < self.total else None
+        }
+
+    def get(self, path, access_token=None, params=None, **kwargs):
+        time.sleep(self.latency)
+        self.calls += 1
+        params = params or {}
+        if '?' in path:
+            path, query = path.split('?', 1)
+            params = dict(pair.split('=') for pair in query.split('&'))
+        return FakeResponse(self.page(int(params.get('offset', 0)), int(params.get('limit', self.limit))))
+
+def walk_pages_sequential(client, first_page):
+    """Baseline: follow `next` links one page at a time"""
+    items = list(first_page['items'])
+    next_url = first_page['next']
+    while next_url:
+        page = client.get(next_url).json()
+        items.extend(page['items'])
+        next_url = page['next']
+    return items
+
+def bench_pagination(total=5000, latency=0.05):
+    client = FakePagedClient(total, latency=latency)
+    spotify.get_client = lambda: client
+    first_page = client.page(0, client.limit)
+
+    start = time.perf_counter()
+    sequential = walk_pages_sequential(client, first_page)
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parallel = spotify.fetch_remaining_pages('token', 'playlists/x/tracks', first_page)
+    parallel_time = time.perf_counter() - start
+
+    assert parallel == sequential, "parallel pagination differs from the sequential walk"
+    print(f"pagination: {total} tracks, {latency * 1000:.0f} ms/page")
+    print(f"  sequential next-walk: {sequential_time:.2f}s")
+    print(f"  parallel offsets ({spotify.PAGE_CONCURRENCY} workers): {parallel_time:.2f}s")
+
+def fake_audio_features(track_id):
+    return {
+        'id': track_id, 'danceability': 0.5, 'energy': 0.6, 'valence': 0.7, 'tempo': 120.0,
+        'key': 5, 'mode': 1, 'loudness': -6.0, 'speechiness': 0.05, 'acousticness': 0.1,
+        'instrumentalness': 0.0, 'liveness': 0.1, 'time_signature': 4,
+        'type': 'audio_features', 'uri': f"spotify:track:{track_id}",
+        'track_href': f"https://api.spotify.com/v1/tracks/{track_id}",
+        'analysis_url': f"https://api.spotify.com/v1/audio-analysis/{track_id}", 'duration_ms': 200000
+    }
+
+def build_playlist_dicts(body, features):
+    """The hand-built nested dicts get_playlist_info used to return"""
+    tracks = []
+    for item in json.loads(body)['items']:
+        if item['track']:
+            track = item['track']
+            tracks.append({
+                'id': track['id'],
+                'name': track['name'],
+                'artists': [artist['name'] for artist in track['artists']],
+                'album': track['album']['name'],
+                'album_image': track['album']['images'][0]['url'] if track['album']['images'] else None,
+                'duration_ms': track['duration_ms'],
+                'preview_url': track.get('preview_url')
+            })
+    features = {feat['id']: feat for feat in json.loads(features)['audio_features']}
+    for track in tracks:
+        track['audio_features'] = features.get(track['id'])
+    return tracks
+
+def build_playlist_records(body, features):
+    tracks = spotify.parse_playlist_tracks(orjson.loads(body)['items'])
+    features = {feat['id']: feat for feat in orjson.loads(features)['audio_features']}
+    for track in tracks:
+        track.audio_features = spotify.AudioFeatures.from_json(features.get(track.id))
+    return tracks
+
+def bench_records(total=10000, rounds=5):
+    client = FakePagedClient(total)
+    page = client.page(0, total)
+    body = orjson.dumps(page)
+    features = orjson.dumps({'audio_features': [fake_audio_features(item['track']['id']) for item in page['items']]})
+
+    print(f"records: {total}-track playlist with audio features ({(len(body) + len(features)) / 1e6:.1f} MB of JSON)")
+    for label, build in (('dicts + json', build_playlist_dicts), ('records + orjson', build_playlist_records)):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            build(body, features)
+        elapsed = (time.perf_counter() - start) / rounds
+
+        tracemalloc.start()
+        result = build(body, features)
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del result
+        print(f"  {label}: {elapsed * 1000:.0f} ms decode, {retained / 1e6:.1f} MB retained")
+
+class FakeYoutubeDL:
+    """Stands in for yt_dlp.YoutubeDL: each extraction sleeps `latency` seconds and writes a small file"""
+    latency = 0.2
+    instances = 0
+
+    def __init__(self, params=None):
+        self.params = dict(params or {})
+        FakeYoutubeDL.instances += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def extract_info(self, url, download=True):
+        time.sleep(self.latency)
+        if url.startswith('ytsearch'):
+            count, query = url[len('ytsearch'):].split(':', 1)
+            return {'entries': fake_candidates(query.replace(' audio', ''))[:int(count or 1)]}
+        video_id = f"vid{abs(hash(url)) % 10 ** 8:08d}"
+        entry = {'id': video_id, 'title': url.split(':', 1)[-1], 'duration': 200, 'ext': 'm4a',
+                 'url': f"https://example.invalid/{video_id}.m4a"}
+        if download:
+            outtmpl = self.params.get('outtmpl', f"{video_id}.%(ext)s")
+            if isinstance(outtmpl, dict):
+                outtmpl = outtmpl['default']
+            path = outtmpl % {'ext': 'm4a'}
+            with open(path, 'wb') as f:
+                f.write(b'\0' * 1024)
+            entry['requested_downloads'] = [{'filepath': path}]
+        return {'entries': [entry]}
+
+    def close(self):
+        pass
+
+def fake_tracks(count):
+    return [{'id': f"track{i:018d}", 'name': f"Track {i}", 'artists': ['Artist'], 'album': 'Album',
+             'duration_ms': 200000} for i in range(count)]
+
+def fake_candidates(title, duration=200):
+    """Search results as YouTube often ranks them: a live version first, the studio track further down"""
+    return [
+        {'id': f"live{abs(hash(title)) % 10 ** 6:06d}", 'title': f"{title} (Live at Wembley)",
+         'duration': duration * 3, 'channel': 'Concerts'},
+        {'id': f"mv{abs(hash(title)) % 10 ** 6:06d}", 'title': f"{title} (Official Music Video)",
+         'duration': duration + 75, 'channel': 'Artist VEVO'},
+        {'id': f"audio{abs(hash(title)) % 10 ** 6:06d}", 'title': f"{title} (Official Audio)",
+         'duration': duration + 2, 'channel': 'Artist - Topic'},
+        {'id': f"cover{abs(hash(title)) % 10 ** 6:06d}", 'title': f"{title} cover",
+         'duration': duration, 'channel': 'Someone'},
+    ]
+
+def bench_matcher(count=1000):
+    """Candidate scoring cost, and the download volume it avoids versus taking the first search hit"""
+    stats = track_matcher.MatchStats()
+    tracks = fake_tracks(count)
+    start = time.perf_counter()
+    for track in tracks:
+        candidates = fake_candidates(f"Artist {track['name']}", track['duration_ms'] // 1000)
+        best, _ = track_matcher.select_best(track, candidates)
+        stats.record(candidates, best)
+    elapsed = time.perf_counter() - start
+    result = stats.stats()
+    print(f"matcher: {count} tracks, {len(candidates)} candidates each")
+    print(f"  scoring: {elapsed / count * 1e6:.1f} us/track")
+    print(f"  matched {result['matched']}, no match {result['no_match']}, "
+          f"first hit rejected {result['first_hit_rejected']}")
+    print(f"  estimated download avoided: {result['bytes_saved_estimate'] / 1e6:.1f} MB "
+          f"({result['bytes_saved_estimate'] / count / 1e6:.2f} MB/track)")
+
+def bench_download_pool(count=16, worker_counts=(1, 2, 4, 8), latency=0.2):
+    yt_download.yt_dlp.YoutubeDL = FakeYoutubeDL
+    FakeYoutubeDL.latency = latency
+    # The fake files aren't audio, so keep them as downloaded
+    passthrough = Transcoder(codec='none')
+    yt_download.get_transcoder = lambda: passthrough
+    cwd = os.getcwd()
+    print(f"download pool: {count} tracks, {latency * 1000:.0f} ms per fake extraction")
+    try:
+        for workers in worker_counts:
+            with tempfile.TemporaryDirectory() as tmp:
+                os.chdir(tmp)
+                # A fresh search cache per run, so later runs don't skip the searches the first one stored
+                search_cache = SearchCache(db_path=os.path.join(tmp, "search.db"))
+                yt_download.get_search_cache = lambda: search_cache
+                start = time.perf_counter()
+                results = yt_download.download_tracks(fake_tracks(count), max_workers=workers,
+                                                      on_progress=lambda *args: None)
+                elapsed = time.perf_counter() - start
+                os.chdir(cwd)
+            ok = sum(1 for success, _ in results if success)
+            print(f"  {workers} worker(s): {elapsed:.2f}s, {ok}/{count} ok")
+    finally:
+        os.chdir(cwd)
+        yt_download.yt_dlp.YoutubeDL = REAL_YOUTUBEDL
+        yt_download.get_transcoder = get_transcoder
+        yt_download.get_search_cache = get_search_cache
+
+def bench_ydl_pool(count=100):
+    """Setup cost of a real YoutubeDL per track vs. one pooled instance (no network involved)"""
+    yt_download.yt_dlp.YoutubeDL = REAL_YOUTUBEDL
+    opts = yt_download.DOWNLOAD_OPTS
+
+    start = time.perf_counter()
+    for i in range(count):
+        with REAL_YOUTUBEDL(dict(opts, outtmpl=f"track{i}.%(ext)s")):
+            pass
+    fresh = time.perf_counter() - start
+
+    pool = YoutubeDLPool()
+    start = time.perf_counter()
+    for i in range(count):
+        with pool.borrow('bench', opts, outtmpl=f"track{i}.%(ext)s"):
+            pass
+    pooled = time.perf_counter() - start
+    pool.close_all()
+
+    print(f"ydl pool: {count} tracks (setup only; HTTP session reuse not included)")
+    print(f"  new YoutubeDL per track: {fresh:.2f}s ({fresh / count * 1000:.1f} ms/track)")
+    print(f"  pooled YoutubeDL: {pooled:.2f}s ({pooled / count * 1000:.2f} ms/track)")
+
+def bench_bandwidth(limit='2M', workers=4, seconds=3.0, chunk=64 * 1024):
+    """Throughput of several workers reporting chunks through one shared limiter"""
+    limiter = BandwidthLimiter(rate=parse_rate(limit))
+    deadline = time.monotonic() + seconds
+
+    def download(worker):
+        key = f"worker{worker}.part"
+        downloaded = 0
+        while time.monotonic() < deadline:
+            limiter.progress_hook({'status': 'downloading', 'tmpfilename': key, 'downloaded_bytes': downloaded})
+            downloaded += chunk
+        limiter.progress_hook({'status': 'finished', 'tmpfilename': key})
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=download, args=(worker,)) for worker in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stats = limiter.stats()
+    print(f"bandwidth: {workers} workers sharing a {limit}/s cap for {seconds:.0f}s")
+    print(f"  achieved {format_rate(stats['bytes'] / elapsed)}, throttled {stats['throttled_time']:.1f}s in total")
+
+BENCHMARKS = {
+    'pagination': bench_pagination,
+    'records': bench_records,
+    'download_pool': bench_download_pool,
+    'ydl_pool': bench_ydl_pool,
+    'matcher': bench_matcher,
+    'bandwidth': bench_bandwidth,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('names', nargs='*', help=f"benchmarks to run: {', '.join(BENCHMARKS)}")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -0,0 +1,29 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decouple import config
+
+DOWNLOAD_WORKERS = config('DOWNLOAD_WORKERS', default=4, cast=int)
+
+def run_pool(items, worker, max_workers=None, on_progress=None):
+    """Run `worker(item)` for every item on a bounded thread pool.
+
+    Returns a list of (True, result) or (False, error message) tuples in input
+    order. A failing item doesn't affect the others. `on_progress(done, total,
+    item, ok)` is called from the calling thread each time an item finishes, so
+    it can safely update the UI.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    if not items:
+        return results
+
+    with ThreadPoolExecutor(max_workers=max_workers or DOWNLOAD_WORKERS, thread_name_prefix='download') as executor:
+        futures = {executor.submit(worker, item): index for index, item in enumerate(items)}
+        for done, future in enumerate(as_completed(futures), 1):
+            index = futures[future]
+            try:
+                results[index] = (True, future.result())
+            except Exception as e:
+                results[index] = (False, str(e))
+            if on_progress:
+                on_progress(done, len(items), items[index], results[index][0])
+    return results
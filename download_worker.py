@@ -0,0 +1,166 @@
+"""Background worker that drains the download job queue.
+
+Run with `python download_worker.py [--workers N]`. Jobs left running by a
+worker that died are requeued on startup, so a restarted worker continues
+where the previous one stopped, resuming their partial files.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from decouple import config
+from bandwidth import get_bandwidth_limiter
+from download_pool import DOWNLOAD_WORKERS
+from job_queue import QUEUED, RUNNING, get_job_queue, get_worker_id
+from partials import reconcile_partials
+from retry_policy import PERMANENT, RetryBudget, classify, get_retry_policy
+from track_matcher import get_match_stats
+from transcoder import get_stage_stats, get_transcoder
+from yt_download import create_download_dir, download_with_retry, find_downloaded, postprocess
+
+POLL_INTERVAL = config('JOB_POLL_INTERVAL', default=2.0, cast=float)
+HEARTBEAT_INTERVAL = config('JOB_HEARTBEAT_INTERVAL', default=30.0, cast=float)
+
+_budgets = {}
+_budgets_lock = threading.Lock()
+
+def get_batch_budget(batch_id):
+    """Retry budget shared by the jobs of one batch in this worker process"""
+    with _budgets_lock:
+        if batch_id not in _budgets:
+            size = sum(get_job_queue().counts(batch_id).values())
+            _budgets[batch_id] = RetryBudget.for_batch(size)
+        return _budgets[batch_id]
+
+def release_batch_budget(batch_id):
+    """Drop a batch's retry budget once none of its jobs is queued or running"""
+    counts = get_job_queue().counts(batch_id)
+    if counts.get(QUEUED) or counts.get(RUNNING):
+        return
+    with _budgets_lock:
+        _budgets.pop(batch_id, None)
+
+def finish_job(job, future=None, error=None):
+    queue = get_job_queue()
+    track_info = job['track_info']
+    if error is None:
+        error = future.exception()
+    if error is None:
+        file_path = future.result()
+        queue.complete(job['id'], file_path)
+        print(f"Downloaded {track_info['name']} -> {file_path}")
+    else:
+        error_class = classify(error)
+        # Requeueing a permanent failure would only repeat it, and requeueing one from a batch
+        # that is out of retries would overrun the batch's budget
+        retry = error_class != PERMANENT and not getattr(error, 'budget_exhausted', False)
+        queue.fail(job['id'], str(error), retry=retry)
+        print(f"Failed to download {track_info['name']} (attempt {job['attempts']}, {error_class}): {str(error)}")
+    release_batch_budget(job['batch_id'])
+
+def run_job(job, download_dir):
+    queue = get_job_queue()
+    track_info = job['track_info']
+    try:
+        file_path = find_downloaded(track_info)
+        if file_path:
+            queue.complete(job['id'], file_path)
+            print(f"Already downloaded {track_info['name']} -> {file_path}")
+            release_batch_budget(job['batch_id'])
+            return
+        file_path = download_with_retry(track_info, download_dir, budget=get_batch_budget(job['batch_id']))
+        # The job completes once the transcoder is done; this thread moves on to the next download
+        postprocess(track_info, file_path).add_done_callback(lambda future: finish_job(job, future))
+    except Exception as e:
+        finish_job(job, error=e)
+
+def work(worker_id, download_dir, stop_event):
+    queue = get_job_queue()
+    while not stop_event.is_set():
+        job = queue.claim(worker_id)
+        if job is None:
+            stop_event.wait(POLL_INTERVAL)
+            continue
+        run_job(job, download_dir)
+
+def published_stats():
+    """Counters the worker publishes with its heartbeat for the app and the API"""
+    return {
+        'bandwidth': get_bandwidth_limiter().stats(),
+        'stages': get_stage_stats().stats(),
+        'retries': get_retry_policy().stats()
+    }
+
+def heartbeat(worker_id, stop_event):
+    queue = get_job_queue()
+    while not stop_event.wait(HEARTBEAT_INTERVAL):
+        queue.heartbeat(worker_id, published_stats())
+
+_spawned_at = 0.0
+
+def ensure_worker_running():
+    """Start a background worker process unless one is already alive"""
+    global _spawned_at
+    if get_job_queue().live_workers(max_age=HEARTBEAT_INTERVAL * 3):
+        return False
+    # The new worker takes a moment to send its first heartbeat
+    if time.time() - _spawned_at < HEARTBEAT_INTERVAL:
+        return False
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__)],
+        cwd=os.getcwd(),
+        start_new_session=True
+    )
+    _spawned_at = time.time()
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Drain the download job queue")
+    parser.add_argument('--workers', type=int, default=DOWNLOAD_WORKERS, help="number of parallel downloads")
+    args = parser.parse_args()
+
+    queue = get_job_queue()
+    worker_id = get_worker_id()
+    download_dir = create_download_dir()
+    requeued = queue.recover()
+    if requeued:
+        print(f"Requeued {requeued} interrupted job(s)")
+    resumable, removed = reconcile_partials(queue.pending(), download_dir)
+    if resumable:
+        resumed_bytes = sum(size for _, _, size in resumable)
+        jobs = len({job_id for _, job_id, _ in resumable})
+        print(f"{len(resumable)} partial file(s) ({resumed_bytes / 1024 ** 2:.1f} MB) will resume for {jobs} job(s)")
+    if removed:
+        print(f"Removed {len(removed)} stale partial file(s)")
+    queue.heartbeat(worker_id, published_stats())
+
+    stop_event = threading.Event()
+    threads = [threading.Thread(target=heartbeat, args=(worker_id, stop_event), daemon=True)]
+    threads += [
+        threading.Thread(target=work, args=(worker_id, download_dir, stop_event), daemon=True)
+        for _ in range(args.workers)
+    ]
+    for thread in threads:
+        thread.start()
+    print(f"Worker {worker_id} started with {args.workers} download thread(s)")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("Stopping worker...")
+    finally:
+        stop_event.set()
+        for thread in threads[1:]:
+            thread.join()
+        get_transcoder().join()
+        queue.remove_worker(worker_id)
+        print(f"Retries by error class: {get_retry_policy().summary()}")
+        print(f"Time per stage: {get_stage_stats().summary()}")
+        print(f"Bandwidth: {get_bandwidth_limiter().summary()}")
+        print(f"Matching: {get_match_stats().summary()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+COLUMNS = ('track_id', 'name', 'artists', 'file_path', 'downloaded_at', 'album', 'album_image')
+
+class DownloadsStore:
+    """SQLite store of downloaded tracks, indexed by track id, file path and album.
+
+    Every add is a single-row transaction, so concurrent download workers and
+    processes can record tracks safely. An existing downloads.json is imported
+    once and renamed to downloads.json.migrated.
+    """
+
+    def __init__(self, db_path, json_path=None):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS downloads (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    track_id TEXT,
+                    name TEXT NOT NULL,
+                    artists TEXT NOT NULL,
+                    file_path TEXT NOT NULL UNIQUE,
+                    downloaded_at TEXT NOT NULL,
+                    album TEXT,
+                    album_image TEXT
+                );
+                CREATE INDEX IF NOT EXISTS downloads_track_id ON downloads (track_id);
+                CREATE INDEX IF NOT EXISTS downloads_album ON downloads (album);
+            """)
+        if json_path and os.path.exists(json_path):
+            self.migrate_json(json_path)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def migrate_json(self, json_path):
+        """Import tracks from the old downloads.json and rename it; returns how many were imported"""
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                tracks = json.load(f).get('tracks', [])
+        except Exception:
+            tracks = []
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO downloads (track_id, name, artists, file_path, downloaded_at, album, album_image) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [self._to_row(track) for track in tracks if track.get('file_path')]
+            )
+        os.replace(json_path, json_path + '.migrated')
+        return len(tracks)
+
+    def _to_row(self, track):
+        return (
+            track.get('track_id') or track.get('id'),
+            track['name'],
+            json.dumps(list(track['artists'])),
+            track['file_path'],
+            track.get('downloaded_at') or time.strftime('%Y-%m-%d %H:%M:%S'),
+            track.get('album', ''),
+            track.get('album_image', '')
+        )
+
+    def _to_track(self, row):
+        track = dict(row)
+        track.pop('id', None)
+        track['artists'] = json.loads(track['artists'])
+        return track
+
+    def add(self, track):
+        """Insert a track unless its file is already recorded; returns True if it was added"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO downloads (track_id, name, artists, file_path, downloaded_at, album, album_image) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._to_row(track)
+            )
+        return cursor.rowcount > 0
+
+    def all(self):
+        rows = self._connect().execute("SELECT * FROM downloads ORDER BY id").fetchall()
+        return [self._to_track(row) for row in rows]
+
+    def by_track_id(self, track_id):
+        rows = self._connect().execute(
+            "SELECT * FROM downloads WHERE track_id = ? ORDER BY id", (track_id,)
+        ).fetchall()
+        return [self._to_track(row) for row in rows]
+
+    def by_album(self, album):
+        rows = self._connect().execute(
+            "SELECT * FROM downloads WHERE album = ? ORDER BY id", (album,)
+        ).fetchall()
+        return [self._to_track(row) for row in rows]
+
+    def remove(self, file_paths):
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM downloads WHERE file_path = ?", [(path,) for path in file_paths])
+
+    def move(self, old_path, new_path):
+        with self._connect() as conn:
+            conn.execute("UPDATE downloads SET file_path = ? WHERE file_path = ?", (new_path, old_path))
+
+    def replace_all(self, tracks):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM downloads")
+            conn.executemany(
+                "INSERT OR IGNORE INTO downloads (track_id, name, artists, file_path, downloaded_at, album, album_image) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [self._to_row(track) for track in tracks]
+            )
@@ -0,0 +1,72 @@
+import json
+import os
+import sqlite3
+import threading
+from decouple import config
+
+CACHE_DIR = config('CACHE_DIR', default=os.path.join(os.getcwd(), "cache"))
+
+def get_cache_path(filename):
+    """Get the path of a file in the cache directory, creating the directory if needed"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, filename)
+
+class AudioFeatureCache:
+    """Persistent SQLite cache of audio features keyed by Spotify track id.
+
+    Audio features of a track never change, so entries are kept forever.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or get_cache_path("audio_features.db")
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS audio_features ("
+                "track_id TEXT PRIMARY KEY, features TEXT NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, track_ids):
+        """Return {track_id: features} for the ids that are cached"""
+        found = {}
+        ids = list(track_ids)
+        conn = self._connect()
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            rows = conn.execute(
+                f"SELECT track_id, features FROM audio_features WHERE track_id IN ({','.join('?' * len(batch))})",
+                batch
+            ).fetchall()
+            found.update((track_id, json.loads(features)) for track_id, features in rows)
+        return found
+
+    def put_many(self, features):
+        """Store audio feature objects, each keyed by its own `id`"""
+        rows = [(feat['id'], json.dumps(feat)) for feat in features if feat and feat.get('id')]
+        if not rows:
+            return
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO audio_features (track_id, features) VALUES (?, ?)",
+                rows
+            )
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_feature_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AudioFeatureCache()
+    return _cache
@@ -0,0 +1,306 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from decouple import config
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+JOB_MAX_ATTEMPTS = config('JOB_MAX_ATTEMPTS', default=3, cast=int)
+# A running job whose worker hasn't sent a heartbeat for this long is handed to another worker
+JOB_STALE_AFTER = config('JOB_STALE_AFTER', default=300, cast=int)
+
+def get_jobs_db_path():
+    """Get the path to the download job queue database"""
+    return os.path.join(os.getcwd(), "download", "jobs.db")
+
+def get_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def track_to_dict(track_info):
+    return track_info.to_dict() if hasattr(track_info, 'to_dict') else dict(track_info)
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class JobQueue:
+    """Durable SQLite-backed queue of track download jobs.
+
+    Jobs move from queued to running to done or failed. A failed attempt is
+    requeued until `max_attempts` is reached. Workers record heartbeats, so jobs
+    left running by a worker that died are picked up again.
+    """
+
+    def __init__(self, db_path=None, max_attempts=JOB_MAX_ATTEMPTS):
+        self.db_path = db_path or get_jobs_db_path()
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self._connect() as conn:
+            has_batch_jobs = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'batch_jobs'"
+            ).fetchone() is not None
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    batch_id TEXT,
+                    label TEXT,
+                    track_id TEXT,
+                    track_info TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    error TEXT,
+                    file_path TEXT,
+                    worker TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+                CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch_id);
+                CREATE INDEX IF NOT EXISTS jobs_track ON jobs (track_id, state);
+                CREATE TABLE IF NOT EXISTS batch_jobs (
+                    batch_id TEXT NOT NULL,
+                    job_id INTEGER NOT NULL,
+                    label TEXT,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (batch_id, job_id)
+                );
+                CREATE TABLE IF NOT EXISTS workers (
+                    worker TEXT PRIMARY KEY,
+                    heartbeat_at REAL NOT NULL,
+                    stats TEXT
+                );
+            """)
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(workers)")}
+            if 'stats' not in columns:
+                conn.execute("ALTER TABLE workers ADD COLUMN stats TEXT")
+            if not has_batch_jobs:
+                # Queues created before batch_jobs existed only know the batch each job was created in
+                conn.execute(
+                    "INSERT OR IGNORE INTO batch_jobs (batch_id, job_id, label, created_at) "
+                    "SELECT batch_id, id, label, created_at FROM jobs WHERE batch_id IS NOT NULL"
+                )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    def enqueue_many(self, tracks_info, batch_id=None, label=None):
+        """Queue a download job per track and return (batch_id, job ids).
+
+        A track that already has a queued or running job reuses that job, which
+        is then listed in the new batch as well as in the one it was created in.
+        """
+        batch_id = batch_id or uuid.uuid4().hex
+        now = time.time()
+        job_ids = []
+        conn = self._transaction()
+        try:
+            for track_info in tracks_info:
+                track = track_to_dict(track_info)
+                track_id = track.get('id')
+                existing = None
+                if track_id:
+                    existing = conn.execute(
+                        "SELECT id FROM jobs WHERE track_id = ? AND state IN (?, ?)",
+                        (track_id, QUEUED, RUNNING)
+                    ).fetchone()
+                if existing:
+                    job_id = existing['id']
+                else:
+                    job_id = conn.execute(
+                        "INSERT INTO jobs (batch_id, label, track_id, track_info, state, max_attempts, "
+                        "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (batch_id, label or track.get('name'), track_id, json.dumps(track), QUEUED,
+                         self.max_attempts, now, now)
+                    ).lastrowid
+                conn.execute(
+                    "INSERT OR IGNORE INTO batch_jobs (batch_id, job_id, label, created_at) VALUES (?, ?, ?, ?)",
+                    (batch_id, job_id, label or track.get('name'), now)
+                )
+                job_ids.append(job_id)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return batch_id, job_ids
+
+    def enqueue(self, track_info, batch_id=None, label=None):
+        """Queue a single track and return its job id"""
+        return self.enqueue_many([track_info], batch_id, label)[1][0]
+
+    def claim(self, worker_id):
+        """Atomically move the oldest queued job to running and return it, or None"""
+        conn = self._transaction()
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE state = ? ORDER BY id LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, worker = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, worker_id, time.time(), row['id'])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        job = self._to_job(row)
+        job['state'] = RUNNING
+        job['attempts'] += 1
+        return job
+
+    def complete(self, job_id, file_path):
+        self._connect().execute(
+            "UPDATE jobs SET state = ?, file_path = ?, error = NULL, updated_at = ? WHERE id = ?",
+            (DONE, file_path, time.time(), job_id)
+        )
+
+    def fail(self, job_id, error, retry=True):
+        """Record a failed attempt; the job is requeued while it has attempts left"""
+        self._connect().execute(
+            "UPDATE jobs SET state = CASE WHEN ? AND attempts < max_attempts THEN ? ELSE ? END, "
+            "error = ?, updated_at = ? WHERE id = ?",
+            (1 if retry else 0, QUEUED, FAILED, str(error), time.time(), job_id)
+        )
+
+    def heartbeat(self, worker_id, stats=None):
+        """Mark a worker, and the jobs it is running, as alive, and publish its `stats`.
+
+        The worker runs in its own process, so this is how the app and the API
+        see its counters.
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO workers (worker, heartbeat_at, stats) VALUES (?, ?, ?)",
+            (worker_id, now, json.dumps(stats) if stats is not None else None)
+        )
+        conn.execute(
+            "UPDATE jobs SET updated_at = ? WHERE worker = ? AND state = ?", (now, worker_id, RUNNING)
+        )
+
+    def remove_worker(self, worker_id):
+        self._connect().execute("DELETE FROM workers WHERE worker = ?", (worker_id,))
+
+    def live_workers(self, max_age=JOB_STALE_AFTER):
+        rows = self._connect().execute(
+            "SELECT worker FROM workers WHERE heartbeat_at > ?", (time.time() - max_age,)
+        ).fetchall()
+        return [row['worker'] for row in rows]
+
+    def worker_stats(self, max_age=JOB_STALE_AFTER):
+        """Return {worker: stats} as last published by each live worker"""
+        rows = self._connect().execute(
+            "SELECT worker, stats FROM workers WHERE heartbeat_at > ? AND stats IS NOT NULL",
+            (time.time() - max_age,)
+        ).fetchall()
+        return {row['worker']: json.loads(row['stats']) for row in rows}
+
+    def recover(self, stale_after=JOB_STALE_AFTER):
+        """Requeue running jobs whose worker died; returns how many were requeued"""
+        host = socket.gethostname()
+        now = time.time()
+        requeued = 0
+        conn = self._transaction()
+        try:
+            rows = conn.execute(
+                "SELECT id, worker, updated_at FROM jobs WHERE state = ?", (RUNNING,)
+            ).fetchall()
+            for row in rows:
+                worker_host, _, pid = (row['worker'] or '').rpartition(':')
+                dead = worker_host == host and pid.isdigit() and not is_process_alive(int(pid))
+                if dead or row['updated_at'] < now - stale_after:
+                    conn.execute(
+                        "UPDATE jobs SET state = ?, worker = NULL, updated_at = ? WHERE id = ?",
+                        (QUEUED, now, row['id'])
+                    )
+                    requeued += 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return requeued
+
+    def get_job(self, job_id):
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def pending(self):
+        """Return the jobs that are queued or running"""
+        rows = self._connect().execute(
+            "SELECT * FROM jobs WHERE state IN (?, ?) ORDER BY id", (QUEUED, RUNNING)
+        ).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def get_batch(self, batch_id):
+        rows = self._connect().execute(
+            "SELECT jobs.* FROM batch_jobs JOIN jobs ON jobs.id = batch_jobs.job_id "
+            "WHERE batch_jobs.batch_id = ? ORDER BY jobs.id", (batch_id,)
+        ).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def counts(self, batch_id=None):
+        """Return {state: number of jobs}, for one batch or for the whole queue"""
+        query = "SELECT state, COUNT(*) AS count FROM jobs"
+        params = ()
+        if batch_id:
+            query += " JOIN batch_jobs ON batch_jobs.job_id = jobs.id WHERE batch_jobs.batch_id = ?"
+            params = (batch_id,)
+        rows = self._connect().execute(query + " GROUP BY state", params).fetchall()
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        counts.update((row['state'], row['count']) for row in rows)
+        return counts
+
+    def recent_batches(self, limit=10):
+        """Return the most recent batches with their label and per-state job counts"""
+        rows = self._connect().execute(
+            "SELECT batch_jobs.batch_id, MIN(batch_jobs.label) AS label, MIN(batch_jobs.created_at) AS created_at, "
+            "COUNT(*) AS total, SUM(state = ?) AS queued, SUM(state = ?) AS running, SUM(state = ?) AS done, "
+            "SUM(state = ?) AS failed "
+            "FROM batch_jobs JOIN jobs ON jobs.id = batch_jobs.job_id "
+            "GROUP BY batch_jobs.batch_id ORDER BY created_at DESC LIMIT ?",
+            (QUEUED, RUNNING, DONE, FAILED, limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _to_job(self, row):
+        job = dict(row)
+        job['track_info'] = json.loads(job['track_info'])
+        return job
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_job_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue()
+    return _queue
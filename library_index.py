@@ -0,0 +1,184 @@
+import os
+import sqlite3
+import threading
+import time
+from decouple import config
+
+LIBRARY_RECONCILE_INTERVAL = config('LIBRARY_RECONCILE_INTERVAL', default=60, cast=int)
+
+class LibraryIndex:
+    """Incremental index of the files under the download directory.
+
+    Directory mtimes and file sizes are kept in the downloads database. A
+    reconcile pass stats every known directory but only lists the ones whose
+    mtime changed, then drops download records whose file is gone. It runs on a
+    background thread, so rendering the library never touches the filesystem.
+    """
+
+    def __init__(self, db_path, root):
+        self.db_path = db_path
+        self.root = os.path.abspath(root)
+        self._local = threading.local()
+        self._reconcile_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.last_reconcile = None
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS library_dirs (
+                    path TEXT PRIMARY KEY,
+                    parent TEXT,
+                    mtime REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS library_dirs_parent ON library_dirs (parent);
+                CREATE TABLE IF NOT EXISTS library_files (
+                    path TEXT PRIMARY KEY,
+                    dir TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS library_files_dir ON library_files (dir);
+            """)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def is_built(self):
+        return self._connect().execute(
+            "SELECT 1 FROM library_dirs WHERE path = ?", (self.root,)
+        ).fetchone() is not None
+
+    def add_file(self, path):
+        """Record a file written by the app, so it is known before the next reconcile"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO library_files (path, dir, size, mtime) VALUES (?, ?, ?, ?)",
+                (os.path.abspath(path), os.path.dirname(os.path.abspath(path)), stat.st_size, stat.st_mtime)
+            )
+
+    def file_size(self, path):
+        row = self._connect().execute(
+            "SELECT size FROM library_files WHERE path = ?", (os.path.abspath(path),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def reconcile(self):
+        """Rescan changed directories and prune download records of missing files.
+
+        The filesystem is walked outside any transaction; each changed directory
+        and the prune are then written in short transactions of their own, so
+        the worker recording a download never waits on a slow scan. Returns the
+        number of directories that were listed.
+        """
+        with self._reconcile_lock:
+            conn = self._connect()
+            known = dict(conn.execute("SELECT path, mtime FROM library_dirs").fetchall())
+            changed = []
+            pending = [(self.root, None)]
+            seen = set()
+            while pending:
+                path, parent = pending.pop()
+                try:
+                    mtime = os.stat(path).st_mtime
+                except OSError:
+                    continue
+                seen.add(path)
+                if known.get(path) == mtime:
+                    # Unchanged: its entries are the same, so only descend into known subdirectories
+                    children = conn.execute(
+                        "SELECT path FROM library_dirs WHERE parent = ?", (path,)
+                    ).fetchall()
+                    pending.extend((child, path) for (child,) in children)
+                    continue
+                try:
+                    subdirs, files = self._scan(path)
+                except OSError:
+                    continue
+                pending.extend((child, path) for child in subdirs)
+                changed.append((path, parent, mtime, files))
+            for path, parent, mtime, files in changed:
+                self._apply(conn, path, parent, mtime, files)
+            removed = set(known) - seen
+            if removed:
+                with conn:
+                    for path in removed:
+                        conn.execute("DELETE FROM library_dirs WHERE path = ?", (path,))
+                        conn.execute("DELETE FROM library_files WHERE dir = ?", (path,))
+            self._prune(conn)
+            self.last_reconcile = time.time()
+            return len(changed)
+
+    def _scan(self, path):
+        """List one directory and return (subdirectories, file rows)"""
+        subdirs = []
+        files = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        files.append((entry.path, path, stat.st_size, stat.st_mtime))
+                except OSError:
+                    continue
+        return subdirs, files
+
+    def _apply(self, conn, path, parent, mtime, files):
+        """Write the scanned files of one directory"""
+        listed = {row[0] for row in files}
+        indexed = conn.execute("SELECT path FROM library_files WHERE dir = ?", (path,)).fetchall()
+        # A file missing from the listing may have been added by `add_file` since the scan, so check it
+        gone = [(indexed_path,) for (indexed_path,) in indexed
+                if indexed_path not in listed and not os.path.exists(indexed_path)]
+        with conn:
+            conn.executemany("DELETE FROM library_files WHERE path = ?", gone)
+            conn.executemany(
+                "INSERT OR REPLACE INTO library_files (path, dir, size, mtime) VALUES (?, ?, ?, ?)", files
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO library_dirs (path, parent, mtime) VALUES (?, ?, ?)",
+                (path, parent, mtime)
+            )
+
+    def _prune(self, conn):
+        prefix = self.root + os.sep
+        # Records outside the download directory aren't indexed, so check them directly, before locking
+        outside = conn.execute(
+            "SELECT file_path FROM downloads WHERE substr(file_path, 1, ?) != ?", (len(prefix), prefix)
+        ).fetchall()
+        missing = [(path,) for (path,) in outside if not os.path.exists(path)]
+        with conn:
+            conn.execute(
+                "DELETE FROM downloads WHERE substr(file_path, 1, ?) = ? "
+                "AND file_path NOT IN (SELECT path FROM library_files)",
+                (len(prefix), prefix)
+            )
+            conn.executemany("DELETE FROM downloads WHERE file_path = ?", missing)
+
+    def start(self, interval=LIBRARY_RECONCILE_INTERVAL):
+        """Reconcile every `interval` seconds on a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True, name='library-index')
+        self._thread.start()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.reconcile()
+            except Exception as e:
+                print(f"Library reconcile failed: {str(e)}")
+
+    def stop(self):
+        self._stop.set()
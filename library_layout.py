@@ -0,0 +1,122 @@
+"""Where downloaded tracks are placed inside the download directory.
+
+Layouts:
+  flat          download/<title> - <artists>.mp3
+  artist_album  download/<first artist>/<album>/<title> - <artists>.mp3
+  hash          download/ab/cd/<title> - <artists>.mp3 (prefix of a hash of the file name)
+
+Run `python library_layout.py --layout artist_album [--dry-run]` to move an
+existing library to another layout; the download history is updated to match.
+"""
+import argparse
+import hashlib
+import os
+import re
+from decouple import config
+from models import artist_names
+
+LAYOUTS = ('flat', 'artist_album', 'hash')
+LIBRARY_LAYOUT = config('LIBRARY_LAYOUT', default='flat')
+MAX_COMPONENT_LENGTH = 150
+
+def safe_component(text, default='Unknown'):
+    """Make text usable as a single file or directory name"""
+    text = re.sub(r'[\\/:*?"<>|\x00-\x1f]', '_', str(text or '')).strip().strip('.')
+    return text[:MAX_COMPONENT_LENGTH].strip() or default
+
+def track_filename(track_info):
+    """File name of a track without its extension"""
+    return safe_component(f"{track_info['name']} - {', '.join(artist_names(track_info))}")
+
+def track_dir(track_info, download_dir, layout=LIBRARY_LAYOUT):
+    """Directory a track is stored in under `layout`"""
+    if layout == 'flat':
+        return download_dir
+    if layout == 'artist_album':
+        artists = artist_names(track_info)
+        return os.path.join(
+            download_dir,
+            safe_component(artists[0] if artists else None),
+            safe_component(track_info.get('album'), default='Singles')
+        )
+    if layout == 'hash':
+        digest = hashlib.sha1(track_filename(track_info).encode('utf-8')).hexdigest()
+        return os.path.join(download_dir, digest[:2], digest[2:4])
+    raise ValueError(f"Unknown library layout {layout!r}, expected one of {', '.join(LAYOUTS)}")
+
+def output_template(track_info, download_dir, layout=LIBRARY_LAYOUT):
+    """yt-dlp output template for a track, creating its directory"""
+    directory = track_dir(track_info, download_dir, layout)
+    os.makedirs(directory, exist_ok=True)
+    # yt-dlp expands %(...)s fields, so a literal % in a title must be escaped
+    return os.path.join(directory, track_filename(track_info).replace('%', '%%') + '.%(ext)s')
+
+def downloaded_path(info):
+    """Final path of the file yt-dlp wrote for a video, from its post-download info"""
+    if not info:
+        return None
+    requested = info.get('requested_downloads') or []
+    if requested and requested[-1].get('filepath'):
+        return requested[-1]['filepath']
+    return info.get('filepath') or info.get('_filename')
+
+def remove_empty_dirs(path, root):
+    """Remove `path` and its parents up to (not including) `root` while they are empty"""
+    root = os.path.abspath(root)
+    path = os.path.abspath(path)
+    while path != root and path.startswith(root + os.sep):
+        try:
+            os.rmdir(path)
+        except OSError:
+            return
+        path = os.path.dirname(path)
+
+def migrate_library(store, download_dir, layout, dry_run=False):
+    """Move every recorded download to where `layout` puts it.
+
+    Returns (moved, skipped) lists of (old path, new path); a track is skipped
+    when its file is missing or the target is taken by another file.
+    """
+    moved = []
+    skipped = []
+    for track in store.all():
+        old_path = track['file_path']
+        extension = os.path.splitext(old_path)[1]
+        new_path = os.path.join(track_dir(track, download_dir, layout), track_filename(track) + extension)
+        if os.path.abspath(old_path) == os.path.abspath(new_path):
+            continue
+        if not os.path.exists(old_path) or os.path.exists(new_path):
+            skipped.append((old_path, new_path))
+            continue
+        if not dry_run:
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            os.replace(old_path, new_path)
+            store.move(old_path, new_path)
+            remove_empty_dirs(os.path.dirname(old_path), download_dir)
+        moved.append((old_path, new_path))
+    return moved, skipped
+
+def main():
+    from yt_download import create_download_dir, get_downloads_store, get_library_index
+
+    parser = argparse.ArgumentParser(description="Move downloaded tracks to another directory layout")
+    parser.add_argument('--layout', default=LIBRARY_LAYOUT, help=f"one of {', '.join(LAYOUTS)}")
+    parser.add_argument('--dry-run', action='store_true', help="only print what would be moved")
+    args = parser.parse_args()
+    if args.layout not in LAYOUTS:
+        parser.error(f"unknown layout {args.layout!r}, expected one of {', '.join(LAYOUTS)}")
+
+    download_dir = create_download_dir()
+    moved, skipped = migrate_library(get_downloads_store(), download_dir, args.layout, dry_run=args.dry_run)
+    for old_path, new_path in moved:
+        print(f"{'Would move' if args.dry_run else 'Moved'} {old_path} -> {new_path}")
+    for old_path, new_path in skipped:
+        print(f"Skipped {old_path} (missing, or {new_path} already exists)")
+    if not args.dry_run:
+        get_library_index().reconcile()
+    print(f"{len(moved)} moved, {len(skipped)} skipped")
+    if args.layout != LIBRARY_LAYOUT:
+        print(f"Set LIBRARY_LAYOUT={args.layout} so new downloads use the same layout")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+from dataclasses import dataclass, fields
+from typing import Optional, Tuple
+
+class Record:
+    """Dict-style access for the record types, so existing `info['name']` call sites keep working.
+
+    Fields left as None are treated as missing by `in`, `keys` and `to_dict`,
+    matching the dicts these records replace, which simply didn't have those
+    keys. The exception is `_always_present`: keys those dicts always had, set
+    to None when empty, which are kept so JSON clients still find them.
+    """
+    __slots__ = ()
+    _always_present = ()
+
+    def __getitem__(self, key):
+        if key not in self._field_names():
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self._field_names():
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def _present(self, name):
+        return getattr(self, name) is not None or name in self._always_present
+
+    def __contains__(self, key):
+        return key in self._field_names() and self._present(key)
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in self._field_names() else None
+        return default if value is None else value
+
+    def keys(self):
+        return [name for name in self._field_names() if self._present(name)]
+
+    @classmethod
+    def _field_names(cls):
+        names = cls.__dict__.get('_names')
+        if names is None:
+            # Declaration order, so keys() and to_dict() list fields the way the old dicts did
+            names = tuple(field.name for field in fields(cls))
+            cls._names = names
+        return names
+
+    def to_dict(self):
+        """Convert to plain dicts and lists, e.g. for JSON output"""
+        result = {}
+        for name in self._field_names():
+            if not self._present(name):
+                continue
+            value = getattr(self, name)
+            if isinstance(value, Record):
+                value = value.to_dict()
+            elif isinstance(value, (list, tuple)):
+                value = [item.to_dict() if isinstance(item, Record) else item for item in value]
+            result[name] = value
+        return result
+
+def artist_names(track_info):
+    """Artist names of a track, whether it lists plain names or Spotify artist objects"""
+    return [artist['name'] if isinstance(artist, dict) else artist for artist in track_info['artists']]
+
+@dataclass(slots=True)
+class AudioFeatures(Record):
+    id: str
+    danceability: float
+    energy: float
+    valence: float
+    tempo: float
+    key: Optional[int] = None
+    mode: Optional[int] = None
+    loudness: Optional[float] = None
+    speechiness: Optional[float] = None
+    acousticness: Optional[float] = None
+    instrumentalness: Optional[float] = None
+    liveness: Optional[float] = None
+    time_signature: Optional[int] = None
+
+    # Spotify's audio features objects always carry every key
+    _always_present = ('key', 'mode', 'loudness', 'speechiness', 'acousticness', 'instrumentalness',
+                       'liveness', 'time_signature')
+
+    @classmethod
+    def from_json(cls, data):
+        if data is None or isinstance(data, AudioFeatures):
+            return data
+        return cls(
+            id=data['id'],
+            danceability=data['danceability'],
+            energy=data['energy'],
+            valence=data['valence'],
+            tempo=data['tempo'],
+            key=data.get('key'),
+            mode=data.get('mode'),
+            loudness=data.get('loudness'),
+            speechiness=data.get('speechiness'),
+            acousticness=data.get('acousticness'),
+            instrumentalness=data.get('instrumentalness'),
+            liveness=data.get('liveness'),
+            time_signature=data.get('time_signature')
+        )
+
+@dataclass(slots=True)
+class Track(Record):
+    name: str
+    artists: Tuple[str, ...]
+    duration_ms: int
+    id: Optional[str] = None
+    album: Optional[str] = None
+    album_type: Optional[str] = None
+    release_date: Optional[str] = None
+    image_url: Optional[str] = None
+    album_image: Optional[str] = None
+    preview_url: Optional[str] = None
+    popularity: Optional[int] = None
+    external_urls: Optional[str] = None
+    track_number: Optional[int] = None
+    audio_features: Optional[AudioFeatures] = None
+
+    _always_present = ('image_url', 'album_image', 'preview_url', 'audio_features')
+
+@dataclass(slots=True)
+class Album(Record):
+    name: str
+    artists: Tuple[str, ...]
+    release_date: str
+    total_tracks: int
+    tracks: list
+    image_url: Optional[str] = None
+    external_urls: Optional[str] = None
+
+    _always_present = ('image_url',)
+
+@dataclass(slots=True)
+class Playlist(Record):
+    name: str
+    owner: str
+    total_tracks: int
+    tracks: list
+    description: Optional[str] = None
+    image_url: Optional[str] = None
+
+    _always_present = ('description', 'image_url')
@@ -0,0 +1,84 @@
+import os
+import re
+import time
+from decouple import config
+from library_layout import track_dir, track_filename
+
+# Partial files not belonging to a pending job are removed once they are this old
+PARTIAL_MAX_AGE = config('PARTIAL_MAX_AGE', default=7 * 24 * 3600, cast=int)
+
+# yt-dlp writes <file>.<ext>.part (and .part-FragN pieces with a .ytdl state file for fragmented
+# streams); the transcoder writes <file>.transcoding.<ext>
+PARTIAL_SUFFIX = re.compile(r'\.(part(-Frag\d+)?(\.part)?|ytdl)$')
+TRANSCODING_SUFFIX = re.compile(r'\.transcoding\.[^.]+$')
+# Extensions of the audio streams the 'bestaudio/best' format selects on YouTube
+AUDIO_EXTENSIONS = ('.webm', '.m4a', '.mp4', '.opus', '.ogg', '.mp3')
+
+def is_partial(path):
+    return bool(PARTIAL_SUFFIX.search(path) or TRANSCODING_SUFFIX.search(path))
+
+def partial_stem(path):
+    """The path of a partial file without its partial suffix and extension"""
+    root, count = TRANSCODING_SUFFIX.subn('', path)
+    if count:
+        return root
+    return os.path.splitext(PARTIAL_SUFFIX.sub('', path))[0]
+
+def job_stem(track_info, download_dir):
+    """The path, without extension, that a track is downloaded to"""
+    return os.path.join(track_dir(track_info, download_dir), track_filename(track_info))
+
+def resume_sizes(track_info, download_dir):
+    """Return {path: size} of the partial files a track's next download attempt continues.
+
+    Only the names yt-dlp can write for the track are checked, so this costs a
+    few stats rather than a listing of the download directory.
+    """
+    stem = job_stem(track_info, download_dir)
+    sizes = {}
+    for extension in AUDIO_EXTENSIONS:
+        path = os.path.abspath(f"{stem}{extension}.part")
+        try:
+            sizes[path] = os.path.getsize(path)
+        except OSError:
+            continue
+    return sizes
+
+def find_partials(download_dir):
+    """Return (path, size, mtime) of every partial file under the download directory"""
+    partials = []
+    for root, _, files in os.walk(download_dir):
+        for name in files:
+            if not is_partial(name):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            partials.append((path, stat.st_size, stat.st_mtime))
+    return partials
+
+def reconcile_partials(jobs, download_dir, max_age=PARTIAL_MAX_AGE):
+    """Tie partial files to pending jobs and remove stale ones that belong to none.
+
+    A partial tied to a job is left in place: the job's next attempt writes to
+    the same name, and yt-dlp continues it with a ranged request. Transcoding
+    temporaries are never continued, since ffmpeg starts over, so they only
+    count as stale. Returns (resumable [(path, job id, size)], removed [path]).
+    """
+    stems = {job_stem(job['track_info'], download_dir): job['id'] for job in jobs}
+    now = time.time()
+    resumable = []
+    removed = []
+    for path, size, mtime in find_partials(download_dir):
+        job_id = None if TRANSCODING_SUFFIX.search(path) else stems.get(partial_stem(path))
+        if job_id is not None:
+            resumable.append((path, job_id, size))
+        elif now - mtime > max_age:
+            try:
+                os.remove(path)
+                removed.append(path)
+            except OSError:
+                pass
+    return resumable, removed
@@ -0,0 +1,123 @@
+import threading
+from collections import deque
+from decouple import config
+
+# Passing a market makes Spotify drop the per-object `available_markets` arrays
+SPOTIFY_MARKET = config('SPOTIFY_MARKET', default='US')
+# Also fetch every projected resource unprojected, to report exactly how many bytes projection saves
+PROJECTION_AUDIT = config('SPOTIFY_PROJECTION_AUDIT', default=False, cast=bool)
+
+class Projection:
+    """The narrowest request a caller needs from one Spotify endpoint"""
+
+    def __init__(self, name, fields=None, market=True):
+        self.name = name
+        self.fields = fields
+        self.market = market
+
+    def params(self, params=None):
+        """Add the projection's `fields` and `market` parameters to a request's params"""
+        params = dict(params or {})
+        if self.fields:
+            params['fields'] = self.fields
+        if self.market and SPOTIFY_MARKET:
+            params.setdefault('market', SPOTIFY_MARKET)
+        return params
+
+TRACK_FIELDS = 'track(id,name,duration_ms,album(name,images(url)),artists(name),preview_url)'
+
+TRACK = Projection('track')
+TRACKS = Projection('tracks')
+ALBUM = Projection('album')
+ALBUM_TRACKS = Projection('album_tracks')
+PLAYLIST = Projection(
+    'playlist',
+    fields=f'name,description,images(url),owner.display_name,tracks(total,limit,items({TRACK_FIELDS}))'
+)
+PLAYLIST_TRACKS = Projection('playlist_tracks', fields=f'items({TRACK_FIELDS})')
+
+def wire_size(response):
+    """Bytes received over the wire, before decompression, if the response exposes them"""
+    raw = getattr(response, 'raw', None)
+    if raw is not None and hasattr(raw, 'tell'):
+        try:
+            return raw.tell()
+        except Exception:
+            pass
+    num_bytes = getattr(response, 'num_bytes_downloaded', None)
+    if num_bytes is not None:
+        return num_bytes
+    length = response.headers.get('Content-Length')
+    return int(length) if length else None
+
+class PayloadStats:
+    """Per-call and per-projection payload sizes.
+
+    Bytes saved by a projection are exact for calls that were also fetched
+    unprojected, and otherwise estimated from the size ratio of the most recent
+    unprojected sample of the same projection. One sample is taken per
+    projection; SPOTIFY_PROJECTION_AUDIT samples every call.
+    """
+
+    def __init__(self, history=100, audit=PROJECTION_AUDIT):
+        self._lock = threading.Lock()
+        self.audit = audit
+        self.calls = deque(maxlen=history)
+        self.totals = {}
+        self._ratios = {}
+        self._sampled = set()
+
+    def wants_unprojected(self, projection):
+        """Whether the caller should also fetch this call unprojected, to measure what projection saves"""
+        if self.audit:
+            return True
+        with self._lock:
+            if projection.name in self._sampled:
+                return False
+            self._sampled.add(projection.name)
+            return True
+
+    def record(self, projection, response, unprojected_bytes=None):
+        body_bytes = len(response.content)
+        wire_bytes = wire_size(response)
+        with self._lock:
+            if unprojected_bytes is not None and body_bytes:
+                self._ratios[projection.name] = unprojected_bytes / body_bytes
+                projection_saved = unprojected_bytes - body_bytes
+            elif projection.name in self._ratios:
+                projection_saved = int(body_bytes * (self._ratios[projection.name] - 1))
+            else:
+                projection_saved = None
+        call = {
+            'projection': projection.name,
+            'url': str(response.url),
+            'body_bytes': body_bytes,
+            'wire_bytes': wire_bytes,
+            'compression_saved': body_bytes - wire_bytes if wire_bytes else 0,
+            'projection_saved': projection_saved,
+            'projection_saved_estimated': unprojected_bytes is None and projection_saved is not None
+        }
+        with self._lock:
+            self.calls.append(call)
+            totals = self.totals.setdefault(projection.name, {
+                'calls': 0, 'body_bytes': 0, 'wire_bytes': 0, 'compression_saved': 0, 'projection_saved': 0
+            })
+            totals['calls'] += 1
+            totals['body_bytes'] += body_bytes
+            totals['wire_bytes'] += wire_bytes or body_bytes
+            totals['compression_saved'] += call['compression_saved']
+            totals['projection_saved'] += call['projection_saved'] or 0
+        return call
+
+    def last_call(self):
+        with self._lock:
+            return self.calls[-1] if self.calls else None
+
+    def summary(self):
+        with self._lock:
+            return {name: dict(totals) for name, totals in self.totals.items()}
+
+_stats = PayloadStats()
+
+def get_payload_stats():
+    return _stats
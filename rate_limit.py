@@ -0,0 +1,146 @@
+import asyncio
+import random
+import threading
+import time
+from decouple import config
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+RATE_LIMIT = config('SPOTIFY_RATE_LIMIT', default=10.0, cast=float)
+RATE_BURST = config('SPOTIFY_RATE_BURST', default=20, cast=int)
+INTERACTIVE_RESERVE = config('SPOTIFY_INTERACTIVE_RESERVE', default=5, cast=int)
+MAX_RETRIES = config('SPOTIFY_MAX_RETRIES', default=4, cast=int)
+BACKOFF_BASE = config('SPOTIFY_BACKOFF_BASE', default=1.0, cast=float)
+BACKOFF_CAP = config('SPOTIFY_BACKOFF_CAP', default=60.0, cast=float)
+# A request told to come back later than this is not retried
+MAX_RETRY_AFTER = config('SPOTIFY_MAX_RETRY_AFTER', default=300.0, cast=float)
+
+def parse_retry_after(retry_after):
+    """Seconds from a Retry-After header, or None if it is missing or not a number"""
+    if retry_after is None:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        return None
+
+class RateLimitScheduler:
+    """Token bucket shared by every thread and async task that calls Spotify.
+
+    Callers reserve a slot and are told how long to wait before sending, so the
+    same bucket works for blocking (`acquire`) and async (`acquire_async`) code.
+    Bulk requests may not dip into the last `interactive_reserve` tokens, which
+    keeps room for interactive lookups while a large playlist is being crawled.
+    A 429 with `Retry-After` pauses the whole bucket until that time.
+    """
+
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_BURST, interactive_reserve=INTERACTIVE_RESERVE,
+                 max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, backoff_cap=BACKOFF_CAP,
+                 max_retry_after=MAX_RETRY_AFTER):
+        self.rate = rate
+        self.burst = burst
+        self.interactive_reserve = min(interactive_reserve, burst - 1)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_retry_after = max_retry_after
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._stats = {
+            'requests': 0,
+            'throttle_events': 0,
+            'retries': 0,
+            'wait_time': 0.0,
+            'retry_wait_time': 0.0,
+            'retry_after_too_long': 0
+        }
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, priority=INTERACTIVE):
+        """Try to take one token; returns (granted, seconds to wait).
+
+        Interactive callers always get a token and wait `delay` before using
+        it. Bulk callers only get one while more than `interactive_reserve`
+        tokens are left; otherwise nothing is taken and they should call again
+        after `delay`. Waiting bulk requests therefore never run the bucket into
+        debt that interactive requests would have to wait out.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            blocked = max(0.0, self._blocked_until - now)
+            if priority == BULK and self._tokens - 1 < self.interactive_reserve:
+                delay = max(blocked, (self.interactive_reserve + 1 - self._tokens) / self.rate)
+                self._stats['wait_time'] += delay
+                return False, delay
+            self._tokens -= 1
+            delay = max(0.0, -self._tokens) / self.rate + blocked
+            self._stats['requests'] += 1
+            self._stats['wait_time'] += delay
+            return True, delay
+
+    def acquire(self, priority=INTERACTIVE):
+        while True:
+            granted, delay = self.reserve(priority)
+            if delay > 0:
+                time.sleep(delay)
+            if granted:
+                return
+
+    async def acquire_async(self, priority=INTERACTIVE):
+        while True:
+            granted, delay = self.reserve(priority)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if granted:
+                return
+
+    def retry_delay(self, attempt, status_code, retry_after=None):
+        """Return the delay before retrying a throttled or failed request.
+
+        `Retry-After` is honoured in full for every caller by pausing the
+        bucket; otherwise the delay is exponential with jitter, capped at
+        `backoff_cap`.
+        """
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            delay = min(self.backoff_cap, self.backoff_base * (2 ** attempt))
+            delay = random.uniform(delay / 2, delay)
+        else:
+            delay += random.uniform(0, self.backoff_base)
+
+        with self._lock:
+            if status_code == 429:
+                self._stats['throttle_events'] += 1
+                if retry_after is not None:
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            self._stats['retries'] += 1
+            self._stats['retry_wait_time'] += delay
+        return delay
+
+    def should_retry(self, status_code, attempt, retry_after=None):
+        """Whether to retry; never when the server asks to wait longer than `max_retry_after`"""
+        if attempt >= self.max_retries or not (status_code == 429 or status_code in (500, 502, 503, 504)):
+            return False
+        wait = parse_retry_after(retry_after)
+        if wait is not None and wait > self.max_retry_after:
+            with self._lock:
+                self._stats['retry_after_too_long'] += 1
+            return False
+        return True
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+_scheduler = RateLimitScheduler()
+
+def get_scheduler():
+    """Get the process-wide scheduler shared by all Spotify clients"""
+    return _scheduler
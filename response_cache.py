@@ -0,0 +1,158 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from decouple import config
+from feature_cache import get_cache_path
+
+RESPONSE_CACHE_TTL = config('RESPONSE_CACHE_TTL', default=300, cast=int)
+RESPONSE_CACHE_MEMORY_ENTRIES = config('RESPONSE_CACHE_MEMORY_ENTRIES', default=256, cast=int)
+RESPONSE_CACHE_MAX_MB = config('RESPONSE_CACHE_MAX_MB', default=200, cast=int)
+
+def make_key(url, params=None):
+    """Build a cache key from a URL and its query parameters"""
+    if not params:
+        return url
+    query = '&'.join(f"{name}={value}" for name, value in sorted(params.items()))
+    return f"{url}?{query}"
+
+class ResponseCache:
+    """Two-tier cache of Spotify response bodies with their ETags.
+
+    Entries live in an in-memory LRU and in an on-disk SQLite store. An entry
+    younger than `ttl` is served as-is; an older one is revalidated with
+    `If-None-Match`, so an unchanged resource costs only a 304.
+    """
+
+    def __init__(self, db_path=None, ttl=RESPONSE_CACHE_TTL,
+                 max_memory_entries=RESPONSE_CACHE_MEMORY_ENTRIES, max_disk_bytes=RESPONSE_CACHE_MAX_MB * 1024 * 1024):
+        self.db_path = db_path or get_cache_path("responses.db")
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'revalidated': 0,
+            'stored': 0,
+            'evictions': 0
+        }
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, etag TEXT, body BLOB NOT NULL, "
+                "size INTEGER NOT NULL, stored_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def is_fresh(self, entry):
+        return time.time() - entry['stored_at'] < self.ttl
+
+    def get(self, key):
+        """Return the cached entry for `key` (fresh or stale), or None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        if entry is not None:
+            self._count('memory_hits')
+            return entry
+
+        conn = self._connect()
+        row = conn.execute("SELECT etag, body, stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count('misses')
+            return None
+        with conn:
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        entry = {'etag': row[0], 'body': bytes(row[1]), 'stored_at': row[2]}
+        self._remember(key, entry)
+        self._count('disk_hits')
+        return entry
+
+    def put(self, key, body, etag=None):
+        now = time.time()
+        entry = {'etag': etag, 'body': body, 'stored_at': now}
+        self._remember(key, entry)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, etag, body, size, stored_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, etag, body, len(body), now, now)
+            )
+        self._count('stored')
+        self._evict_disk()
+        return entry
+
+    def revalidated(self, key, entry):
+        """Mark a stale entry as fresh again after a 304 Not Modified"""
+        now = time.time()
+        entry = dict(entry, stored_at=now)
+        self._remember(key, entry)
+        with self._connect() as conn:
+            conn.execute("UPDATE responses SET stored_at = ?, last_used = ? WHERE key = ?", (now, now, key))
+        self._count('revalidated')
+        return entry
+
+    def _evict_disk(self):
+        conn = self._connect()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        evicted = 0
+        with conn:
+            for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+                if total <= self.max_disk_bytes:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+        with self._lock:
+            self._stats['evictions'] += evicted
+
+    def invalidate(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,151 @@
+import random
+import re
+import threading
+from decouple import config
+
+TRANSIENT = 'transient'
+THROTTLED = 'throttled'
+PERMANENT = 'permanent'
+ERROR_CLASSES = (TRANSIENT, THROTTLED, PERMANENT)
+
+DOWNLOAD_MAX_ATTEMPTS = config('DOWNLOAD_MAX_ATTEMPTS', default=3, cast=int)
+DOWNLOAD_BACKOFF_BASE = config('DOWNLOAD_BACKOFF_BASE', default=2.0, cast=float)
+DOWNLOAD_THROTTLE_BACKOFF_BASE = config('DOWNLOAD_THROTTLE_BACKOFF_BASE', default=15.0, cast=float)
+DOWNLOAD_BACKOFF_CAP = config('DOWNLOAD_BACKOFF_CAP', default=120.0, cast=float)
+# Retries a batch may spend in total, as a fraction of its number of tracks
+DOWNLOAD_RETRY_BUDGET = config('DOWNLOAD_RETRY_BUDGET', default=0.2, cast=float)
+
+# Matched against the lower-cased error message; yt-dlp reports most failures as a DownloadError string
+THROTTLED_PATTERNS = re.compile(
+    r"http error 429|too many requests|rate.?limit|confirm you.?re not a bot|http error 403"
+)
+PERMANENT_PATTERNS = re.compile(
+    r"video unavailable|private video|not available|has been removed|copyright|members.only|"
+    r"confirm your age|age.restricted|unsupported url|no video formats|requested format is not available|"
+    r"no video found|http error 404|http error 410"
+)
+
+class DownloadFailed(Exception):
+    """A download that gave up, with the class of the error that ended it"""
+
+    def __init__(self, message, error_class=TRANSIENT, budget_exhausted=False):
+        super().__init__(message)
+        self.error_class = error_class
+        # The batch has no retries left, so requeueing the job would bypass its budget
+        self.budget_exhausted = budget_exhausted
+
+def classify(error):
+    """Classify an exception as TRANSIENT, THROTTLED or PERMANENT"""
+    error_class = getattr(error, 'error_class', None)
+    if error_class in ERROR_CLASSES:
+        return error_class
+    message = str(error).lower()
+    if THROTTLED_PATTERNS.search(message):
+        return THROTTLED
+    if PERMANENT_PATTERNS.search(message):
+        return PERMANENT
+    if isinstance(error, OSError):
+        # Timeouts, resets and other network errors
+        return TRANSIENT
+    # yt-dlp marks errors it expects to be reproducible, such as removed videos
+    if getattr(error, 'expected', False):
+        return PERMANENT
+    return TRANSIENT
+
+class RetryBudget:
+    """Retries shared by all downloads of one batch, so a bad batch can't retry forever"""
+
+    def __init__(self, retries):
+        self.retries = retries
+        self.used = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_batch(cls, size, ratio=DOWNLOAD_RETRY_BUDGET, minimum=DOWNLOAD_MAX_ATTEMPTS - 1):
+        return cls(max(minimum, int(size * ratio)))
+
+    def take(self):
+        with self._lock:
+            if self.used >= self.retries:
+                return False
+            self.used += 1
+            return True
+
+    def exhausted(self):
+        with self._lock:
+            return self.used >= self.retries
+
+class RetryPolicy:
+    """Decides whether and when a failed download is retried.
+
+    Permanent errors fail at once. Transient and throttled errors back off
+    exponentially with jitter, throttled ones from a longer base, up to
+    `backoff_cap`. Failures, retries, give-ups and backoff time are counted per
+    error class.
+    """
+
+    def __init__(self, max_attempts=DOWNLOAD_MAX_ATTEMPTS, backoff_base=DOWNLOAD_BACKOFF_BASE,
+                 throttle_backoff_base=DOWNLOAD_THROTTLE_BACKOFF_BASE, backoff_cap=DOWNLOAD_BACKOFF_CAP):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.throttle_backoff_base = throttle_backoff_base
+        self.backoff_cap = backoff_cap
+        self._lock = threading.Lock()
+        self._stats = {
+            error_class: {'failures': 0, 'retries': 0, 'gave_up': 0, 'backoff_time': 0.0}
+            for error_class in ERROR_CLASSES
+        }
+        self._stats['budget_exhausted'] = 0
+
+    def classify(self, error):
+        return classify(error)
+
+    def backoff(self, error_class, attempt):
+        base = self.throttle_backoff_base if error_class == THROTTLED else self.backoff_base
+        delay = min(self.backoff_cap, base * (2 ** (attempt - 1)))
+        return random.uniform(delay / 2, delay)
+
+    def next_delay(self, error_class, attempt, max_attempts=None, budget=None):
+        """Record failed attempt number `attempt` and return the delay before retrying, or None to give up"""
+        max_attempts = max_attempts or self.max_attempts
+        with self._lock:
+            stats = self._stats[error_class]
+            stats['failures'] += 1
+            if error_class == PERMANENT or attempt >= max_attempts:
+                stats['gave_up'] += 1
+                return None
+        if budget is not None and not budget.take():
+            with self._lock:
+                stats['gave_up'] += 1
+                self._stats['budget_exhausted'] += 1
+            return None
+        delay = self.backoff(error_class, attempt)
+        with self._lock:
+            stats['retries'] += 1
+            stats['backoff_time'] += delay
+        return delay
+
+    def stats(self):
+        with self._lock:
+            return {
+                key: dict(value) if isinstance(value, dict) else value
+                for key, value in self._stats.items()
+            }
+
+    def summary(self):
+        return retry_summary(self.stats())
+
+def retry_summary(stats):
+    """One-line summary of `RetryPolicy.stats()`, also of stats published by another process"""
+    parts = [
+        f"{error_class}: {stats[error_class]['failures']} failed, {stats[error_class]['retries']} retried, "
+        f"{stats[error_class]['backoff_time']:.1f}s backoff"
+        for error_class in ERROR_CLASSES
+    ]
+    return "; ".join(parts) + f"; budget exhausted {stats['budget_exhausted']}x"
+
+_policy = RetryPolicy()
+
+def get_retry_policy():
+    """Get the process-wide download retry policy"""
+    return _policy
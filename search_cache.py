@@ -0,0 +1,136 @@
+import re
+import sqlite3
+import threading
+import time
+from decouple import config
+from feature_cache import get_cache_path
+from models import artist_names
+
+SEARCH_CACHE_TTL = config('SEARCH_CACHE_TTL', default=30 * 24 * 3600, cast=int)
+SEARCH_CACHE_MAX_ENTRIES = config('SEARCH_CACHE_MAX_ENTRIES', default=50000, cast=int)
+
+def normalize(text):
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text.lower()).split())
+
+def cache_key(track_info):
+    """Key a track by its Spotify id, falling back to normalized artists and title"""
+    track_id = track_info.get('id')
+    if track_id:
+        return f"spotify:{track_id}"
+    return f"search:{normalize(' '.join(artist_names(track_info)))}|{normalize(track_info['name'])}"
+
+def video_url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+def first_entry(info):
+    """Return the video info from a search result or a direct video extraction"""
+    if not info:
+        return None
+    if 'entries' in info:
+        entries = [entry for entry in info['entries'] if entry]
+        return entries[0] if entries else None
+    return info
+
+class SearchCache:
+    """Persistent map from a Spotify track to the video chosen for it.
+
+    Only the video id is stored: stream URLs expire within hours, while the
+    match itself stays valid, so a hit skips the search but not format
+    extraction. Entries expire after `ttl` seconds, and the least recently used
+    ones are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, db_path=None, ttl=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_MAX_ENTRIES):
+        self.db_path = db_path or get_cache_path("search.db")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'stored': 0, 'invalidated': 0, 'evictions': 0}
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_results ("
+                "key TEXT PRIMARY KEY, video_id TEXT NOT NULL, "
+                "resolved_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS search_results_last_used ON search_results (last_used)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def lookup(self, track_info):
+        """Return the cached video id for a track, or None"""
+        key = cache_key(track_info)
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT video_id, resolved_at FROM search_results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self._count('misses')
+            return None
+        now = time.time()
+        with conn:
+            if now - row[1] > self.ttl:
+                conn.execute("DELETE FROM search_results WHERE key = ?", (key,))
+                self._count('expired')
+                self._count('misses')
+                return None
+            conn.execute("UPDATE search_results SET last_used = ? WHERE key = ?", (now, key))
+        self._count('hits')
+        return row[0]
+
+    def store(self, track_info, video_id):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO search_results (key, video_id, resolved_at, last_used) VALUES (?, ?, ?, ?)",
+                (cache_key(track_info), video_id, now, now)
+            )
+            excess = conn.execute("SELECT COUNT(*) FROM search_results").fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM search_results WHERE key IN "
+                    "(SELECT key FROM search_results ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+        self._count('stored')
+        if excess > 0:
+            self._count('evictions', excess)
+
+    def invalidate(self, track_info):
+        """Forget the match for a track, e.g. because the video became unavailable"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM search_results WHERE key = ?", (cache_key(track_info),))
+        self._count('invalidated')
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM search_results")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_search_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SearchCache()
+    return _cache
@@ -0,0 +1,49 @@
+import asyncio
+
+class SingleFlight:
+    """Coalesces concurrent identical async calls into one.
+
+    The first caller for a key starts the computation; callers arriving while
+    it is in flight await the same task and get its result or exception. The
+    task is shielded, so a caller that disconnects doesn't cancel it for the
+    others. Nothing is cached once the task finishes.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._inflight = {}
+        self._stats = {'calls': 0, 'coalesced': 0}
+
+    async def run(self, key, func, *args, **kwargs):
+        self._stats['calls'] += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self._stats['coalesced'] += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved in case every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats['in_flight'] = len(self._inflight)
+        return stats
+
+_flights = {}
+
+def get_flight(stage):
+    """Get the SingleFlight of a pipeline stage, such as 'token', 'metadata' or 'url'"""
+    if stage not in _flights:
+        _flights[stage] = SingleFlight(stage)
+    return _flights[stage]
+
+def coalescing_stats():
+    return {stage: flight.stats() for stage, flight in _flights.items()}
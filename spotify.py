@@ -1,12 +1,24 @@
-import requests
+import asyncio
 import json
+from orjson import loads
 from decouple import config
 import re
 from datetime import datetime
 from spotipy.exceptions import SpotifyException
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from feature_cache import get_feature_cache
+from models import Album, AudioFeatures, Playlist, Track
+from projection import ALBUM, ALBUM_TRACKS, PLAYLIST, PLAYLIST_TRACKS, TRACK, TRACKS
+from rate_limit import BULK, INTERACTIVE
+from spotify_client import BASE_URL, get_async_client, get_client
+from token_cache import get_cached_token
 
-BASE_URL = "https://api.spotify.com/v1"
+# Number of paginated offset pages fetched at the same time
+PAGE_CONCURRENCY = config('SPOTIFY_PAGE_CONCURRENCY', default=4, cast=int)
+
+# Number of 50-id audio-features batches fetched at the same time
+FEATURE_CONCURRENCY = config('SPOTIFY_FEATURE_CONCURRENCY', default=4, cast=int)
 
 def get_access_token():
     try:
@@ -16,29 +28,17 @@ def get_access_token():
         if not client_id or not client_secret:
             return None, "Spotify credentials not found. Please check your .env file."
         
-        # Get access token using client credentials flow
-        auth_response = requests.post(
-            'https://accounts.spotify.com/api/token',
-            data={
-                'grant_type': 'client_credentials',
-                'client_id': client_id,
-                'client_secret': client_secret,
-            }
-        )
-        
-        if auth_response.status_code != 200:
+        # Get access token using client credentials flow, cached until shortly before it expires
+        access_token, error = get_cached_token(client_id, client_secret)
+        if not access_token:
             return None, "Failed to get access token"
             
-        auth_data = auth_response.json()
-        return auth_data['access_token'], None
+        return access_token, None
     except Exception as e:
         return None, f"Failed to get access token: {str(e)}"
 
 def get_headers(access_token):
-    return {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
+    return get_client().headers(access_token)
 
 def extract_spotify_id(url):
     patterns = {
@@ -53,132 +53,328 @@ def extract_spotify_id(url):
             return content_type, match.group(1)
     return None, None
 
-def get_audio_features(access_token, track_ids):
+SPOTIFY_ID_PATTERN = re.compile(r'[a-zA-Z0-9]{22}')
+
+def is_valid_spotify_id(spotify_id):
+    """Spotify ids are 22 base62 characters; /tracks rejects a whole batch over one malformed id"""
+    return isinstance(spotify_id, str) and SPOTIFY_ID_PATTERN.fullmatch(spotify_id) is not None
+
+def unique_ids(track_ids):
     if not isinstance(track_ids, list):
         track_ids = [track_ids]
+    return list(dict.fromkeys(track_id for track_id in track_ids if track_id))
+
+def fetch_audio_features_batch(access_token, batch, priority=BULK):
+    response = get_client().get(
+        "audio-features",
+        access_token,
+        params={'ids': ','.join(batch)},
+        priority=priority
+    )
+    if response.status_code != 200:
+        print(f"Could not fetch audio features (Status: {response.status_code})")
+        return []
+    return loads(response.content)['audio_features'] or []
+
+def get_audio_features(access_token, track_ids, max_workers=FEATURE_CONCURRENCY, priority=BULK):
+    """Get {track_id: features} for the given ids.
+
+    Cached features are served from the persistent cache; the rest are fetched
+    in concurrent 50-id batches. Results are keyed by each feature's own `id`,
+    since Spotify returns `null` in place of tracks it has no features for.
+    """
+    track_ids = unique_ids(track_ids)
+    
+    try:
+        cache = get_feature_cache()
+        features = cache.get_many(track_ids)
+        missing = [track_id for track_id in track_ids if track_id not in features]
+        batches = [missing[i:i + 50] for i in range(0, len(missing), 50)]
+        
+        if batches:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                fetched = [feat for batch_features in executor.map(
+                    lambda batch: fetch_audio_features_batch(access_token, batch, priority), batches
+                ) for feat in batch_features if feat]
+            cache.put_many(fetched)
+            features.update((feat['id'], feat) for feat in fetched)
+        return features
+    except Exception as e:
+        print(f"Could not fetch audio features: {str(e)}")
+        return {}
+
+async def get_audio_features_async(access_token, track_ids, max_workers=FEATURE_CONCURRENCY, priority=BULK):
+    track_ids = unique_ids(track_ids)
     
     try:
-        features = []
-        for i in range(0, len(track_ids), 50):
-            batch = track_ids[i:i + 50]
-            response = requests.get(
-                f"{BASE_URL}/audio-features",
-                headers=get_headers(access_token),
-                params={'ids': ','.join(batch)}
-            )
-            if response.status_code == 200:
-                batch_features = response.json()['audio_features']
-                if batch_features:
-                    features.extend(batch_features)
-        return {track_ids[i]: feat for i, feat in enumerate(features) if feat} if features else {}
+        cache = get_feature_cache()
+        features = await asyncio.to_thread(cache.get_many, track_ids)
+        missing = [track_id for track_id in track_ids if track_id not in features]
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def fetch_batch(batch):
+            async with semaphore:
+                response = await get_async_client().get(
+                    "audio-features",
+                    access_token,
+                    params={'ids': ','.join(batch)},
+                    priority=priority
+                )
+            if response.status_code != 200:
+                print(f"Could not fetch audio features (Status: {response.status_code})")
+                return []
+            return loads(response.content)['audio_features'] or []
+
+        results = await asyncio.gather(*(fetch_batch(missing[i:i + 50]) for i in range(0, len(missing), 50)))
+        fetched = [feat for batch_features in results for feat in batch_features if feat]
+        if fetched:
+            await asyncio.to_thread(cache.put_many, fetched)
+            features.update((feat['id'], feat) for feat in fetched)
+        return features
     except Exception as e:
         print(f"Could not fetch audio features: {str(e)}")
         return {}
 
+def requested_id(track_data):
+    """The id a track was asked for by.
+
+    With a market set, Spotify relinks tracks that aren't playable there to an
+    equivalent that is: `id` is then the substitute and `linked_from` holds the
+    original.
+    """
+    return (track_data.get('linked_from') or track_data).get('id')
+
+def parse_track_info(track_data, audio_features):
+    album = track_data['album']
+    return Track(
+        id=requested_id(track_data),
+        name=track_data['name'],
+        artists=tuple(artist['name'] for artist in track_data['artists']),
+        album=album['name'],
+        album_type=album['album_type'],
+        release_date=album['release_date'],
+        image_url=album['images'][0]['url'] if album['images'] else None,
+        duration_ms=track_data['duration_ms'],
+        preview_url=track_data['preview_url'],
+        popularity=track_data['popularity'],
+        external_urls=track_data['external_urls']['spotify'],
+        audio_features=AudioFeatures.from_json(audio_features)
+    )
+
 def get_track_info(access_token, track_id):
     try:
-        response = requests.get(
-            f"{BASE_URL}/tracks/{track_id}",
-            headers=get_headers(access_token)
-        )
+        response = get_client().get(f"tracks/{track_id}", access_token, projection=TRACK)
+        
+        if response.status_code != 200:
+            return None, f"Failed to fetch track data (Status: {response.status_code})"
+            
+        track_data = loads(response.content)
+        audio_features = get_audio_features(access_token, track_id, priority=INTERACTIVE)
+        
+        return parse_track_info(track_data, audio_features.get(track_id)), None
+    except Exception as e:
+        return None, f"Error fetching track information: {str(e)}"
+
+async def get_track_info_async(access_token, track_id):
+    try:
+        response = await get_async_client().get(f"tracks/{track_id}", access_token, projection=TRACK)
         
         if response.status_code != 200:
             return None, f"Failed to fetch track data (Status: {response.status_code})"
             
-        track_data = response.json()
-        audio_features = get_audio_features(access_token, track_id)
+        track_data = loads(response.content)
+        audio_features = await get_audio_features_async(access_token, track_id, priority=INTERACTIVE)
+        
+        return parse_track_info(track_data, audio_features.get(track_id)), None
+    except Exception as e:
+        return None, f"Error fetching track information: {str(e)}"
+
+def fetch_tracks_batch(access_token, batch, priority=BULK):
+    response = get_client().get(
+        "tracks",
+        access_token,
+        params={'ids': ','.join(batch)},
+        priority=priority,
+        projection=TRACKS
+    )
+    if response.status_code != 200:
+        raise Exception(f"Failed to fetch track data (Status: {response.status_code})")
+    return loads(response.content)['tracks']
+
+def get_tracks_info(access_token, track_ids, max_workers=PAGE_CONCURRENCY):
+    """Get info for many tracks, resolving up to 50 ids per /tracks call.
+
+    Returns ({track_id: info}, error); malformed ids and ids Spotify doesn't
+    know are left out.
+    """
+    track_ids = [track_id for track_id in unique_ids(track_ids) if is_valid_spotify_id(track_id)]
+    
+    try:
+        batches = [track_ids[i:i + 50] for i in range(0, len(track_ids), 50)]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            tracks = [track for batch_tracks in executor.map(
+                lambda batch: fetch_tracks_batch(access_token, batch), batches
+            ) for track in batch_tracks if track]
+        audio_features = get_audio_features(access_token, [track['id'] for track in tracks])
         
         return {
-            'name': track_data['name'],
-            'artists': [artist['name'] for artist in track_data['artists']],
-            'album': track_data['album']['name'],
-            'album_type': track_data['album']['album_type'],
-            'release_date': track_data['album']['release_date'],
-            'image_url': track_data['album']['images'][0]['url'] if track_data['album']['images'] else None,
-            'duration_ms': track_data['duration_ms'],
-            'preview_url': track_data['preview_url'],
-            'popularity': track_data['popularity'],
-            'external_urls': track_data['external_urls']['spotify'],
-            'audio_features': audio_features.get(track_id)
+            requested_id(track): parse_track_info(track, audio_features.get(track['id']))
+            for track in tracks
         }, None
     except Exception as e:
         return None, f"Error fetching track information: {str(e)}"
 
-def get_album_info(access_token, album_id):
+async def get_tracks_info_async(access_token, track_ids, max_workers=PAGE_CONCURRENCY):
+    track_ids = [track_id for track_id in unique_ids(track_ids) if is_valid_spotify_id(track_id)]
+    
     try:
-        album_response = requests.get(
-            f"{BASE_URL}/albums/{album_id}",
-            headers=get_headers(access_token)
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def fetch_batch(batch):
+            async with semaphore:
+                response = await get_async_client().get(
+                    "tracks",
+                    access_token,
+                    params={'ids': ','.join(batch)},
+                    priority=BULK,
+                    projection=TRACKS
+                )
+            if response.status_code != 200:
+                raise Exception(f"Failed to fetch track data (Status: {response.status_code})")
+            return loads(response.content)['tracks']
+
+        results = await asyncio.gather(*(fetch_batch(track_ids[i:i + 50]) for i in range(0, len(track_ids), 50)))
+        tracks = [track for batch_tracks in results for track in batch_tracks if track]
+        audio_features = await get_audio_features_async(access_token, [track['id'] for track in tracks])
+        
+        return {
+            requested_id(track): parse_track_info(track, audio_features.get(track['id']))
+            for track in tracks
+        }, None
+    except Exception as e:
+        return None, f"Error fetching track information: {str(e)}"
+
+def fetch_remaining_pages(access_token, path, first_page, params=None, max_workers=PAGE_CONCURRENCY,
+                          cache=False, projection=None):
+    """Fetch every page after `first_page` in parallel and return all items in order.
+
+    Offsets are computed from the first page's `total` and `limit`, so the pages
+    don't have to be walked one `next` link at a time.
+    """
+    items = list(first_page['items'])
+    total = first_page.get('total', len(items))
+    limit = first_page.get('limit') or len(items)
+    if not limit or len(items) >= total:
+        return items
+
+    def fetch_page(offset):
+        response = get_client().get(
+            path,
+            access_token,
+            params={**(params or {}), 'offset': offset, 'limit': limit},
+            priority=BULK,
+            cache=cache,
+            projection=projection
         )
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch page at offset {offset} (Status: {response.status_code})")
+        return loads(response.content)['items']
+
+    offsets = range(len(items), total, limit)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for page in executor.map(fetch_page, offsets):
+            items.extend(page)
+    return items
+
+def parse_album_info(album_data, album_tracks):
+    album_image = album_data['images'][0]['url'] if album_data['images'] else None
+    return Album(
+        name=album_data['name'],
+        artists=tuple(artist['name'] for artist in album_data['artists']),
+        release_date=album_data['release_date'],
+        total_tracks=album_data['total_tracks'],
+        image_url=album_image,
+        external_urls=album_data['external_urls']['spotify'],
+        tracks=[Track(
+            id=track.get('id'),
+            name=track['name'],
+            artists=tuple(artist['name'] for artist in track['artists']),
+            duration_ms=track['duration_ms'],
+            preview_url=track['preview_url'],
+            track_number=track['track_number'],
+            album=album_data['name'],
+            album_image=album_image
+        ) for track in album_tracks]
+    )
+
+def get_album_info(access_token, album_id, use_cache=True):
+    try:
+        album_response = get_client().get(f"albums/{album_id}", access_token, cache=use_cache, projection=ALBUM)
         
         if album_response.status_code != 200:
             return None, f"Failed to fetch album data (Status: {album_response.status_code})"
             
-        album_data = album_response.json()
+        album_data = loads(album_response.content)
+        album_tracks = fetch_remaining_pages(
+            access_token, f"albums/{album_id}/tracks", album_data['tracks'],
+            cache=use_cache, projection=ALBUM_TRACKS
+        )
         
-        return {
-            'name': album_data['name'],
-            'artists': [artist['name'] for artist in album_data['artists']],
-            'release_date': album_data['release_date'],
-            'total_tracks': album_data['total_tracks'],
-            'image_url': album_data['images'][0]['url'] if album_data['images'] else None,
-            'external_urls': album_data['external_urls']['spotify'],
-            'tracks': [{
-                'name': track['name'],
-                'artists': [artist['name'] for artist in track['artists']],
-                'duration_ms': track['duration_ms'],
-                'preview_url': track['preview_url'],
-                'track_number': track['track_number'],
-                'album_image': album_data['images'][0]['url'] if album_data['images'] else None
-            } for track in album_data['tracks']['items']]
-        }, None
+        return parse_album_info(album_data, album_tracks), None
     except Exception as e:
         return None, f"Error fetching album information: {str(e)}"
 
-def get_playlist_info(access_token, playlist_id):
+def parse_playlist_tracks(playlist_items):
+    tracks = []
+    for item in playlist_items:
+        track = item['track']
+        if track:
+            album_images = track['album']['images']
+            tracks.append(Track(
+                id=track['id'],
+                name=track['name'],
+                artists=tuple(artist['name'] for artist in track['artists']),
+                album=track['album']['name'],
+                album_image=album_images[0]['url'] if album_images else None,
+                duration_ms=track['duration_ms'],
+                preview_url=track.get('preview_url')
+            ))
+    return tracks
+
+def get_playlist_info(access_token, playlist_id, use_cache=True):
     try:
-        playlist_response = requests.get(
-            f"{BASE_URL}/playlists/{playlist_id}",
-            headers=get_headers(access_token),
-            params={
-                'fields': 'id,name,description,images,owner.display_name,followers.total,public,tracks.items(track(id,name,duration_ms,album(name,images),artists(name,id),preview_url))'
-            }
+        playlist_response = get_client().get(
+            f"playlists/{playlist_id}",
+            access_token,
+            cache=use_cache,
+            projection=PLAYLIST
         )
         
         if playlist_response.status_code != 200:
             return None, f"Failed to fetch playlist data (Status: {playlist_response.status_code})"
             
-        playlist_data = playlist_response.json()
-        tracks = []
-        track_ids = []
-        
-        for item in playlist_data['tracks']['items']:
-            if item['track']:
-                track = item['track']
-                track_ids.append(track['id'])
-                tracks.append({
-                    'id': track['id'],
-                    'name': track['name'],
-                    'artists': [artist['name'] for artist in track['artists']],
-                    'album': track['album']['name'],
-                    'album_image': track['album']['images'][0]['url'] if track['album']['images'] else None,
-                    'duration_ms': track['duration_ms'],
-                    'preview_url': track.get('preview_url')
-                })
-        
-        audio_features = get_audio_features(access_token, track_ids)
+        playlist_data = loads(playlist_response.content)
+        playlist_items = fetch_remaining_pages(
+            access_token,
+            f"playlists/{playlist_id}/tracks",
+            playlist_data['tracks'],
+            cache=use_cache,
+            projection=PLAYLIST_TRACKS
+        )
+        tracks = parse_playlist_tracks(playlist_items)
+        audio_features = get_audio_features(access_token, [track.id for track in tracks])
         
         for track in tracks:
-            track['audio_features'] = audio_features.get(track['id'])
+            track.audio_features = AudioFeatures.from_json(audio_features.get(track.id))
         
-        return {
-            'name': playlist_data['name'],
-            'owner': playlist_data['owner']['display_name'],
-            'description': playlist_data.get('description'),
-            'image_url': playlist_data['images'][0]['url'] if playlist_data['images'] else None,
-            'total_tracks': len(tracks),
-            'tracks': tracks
-        }, None
+        return Playlist(
+            name=playlist_data['name'],
+            owner=playlist_data['owner']['display_name'],
+            description=playlist_data.get('description'),
+            image_url=playlist_data['images'][0]['url'] if playlist_data['images'] else None,
+            total_tracks=len(tracks),
+            tracks=tracks
+        ), None
     except Exception as e:
         return None, f"Error fetching playlist information: {str(e)}"
 
@@ -0,0 +1,221 @@
+import asyncio
+import threading
+import time
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from decouple import config
+from projection import get_payload_stats
+from rate_limit import INTERACTIVE, get_scheduler
+from response_cache import get_response_cache, make_key
+
+BASE_URL = "https://api.spotify.com/v1"
+TOKEN_URL = "https://accounts.spotify.com/api/token"
+
+DEFAULT_POOL_SIZE = config('SPOTIFY_POOL_SIZE', default=10, cast=int)
+DEFAULT_CONNECT_TIMEOUT = config('SPOTIFY_CONNECT_TIMEOUT', default=5.0, cast=float)
+DEFAULT_READ_TIMEOUT = config('SPOTIFY_READ_TIMEOUT', default=30.0, cast=float)
+
+class SpotifyClient:
+    """Shared HTTP client for the Spotify Web API with keep-alive connection pooling"""
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, base_url=BASE_URL, scheduler=None):
+        self.base_url = base_url.rstrip('/')
+        self.scheduler = scheduler or get_scheduler()
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._adapter = adapter
+        self._lock = threading.Lock()
+        self._requests = 0
+
+    def url(self, path):
+        """Build a full URL from a path relative to the API base URL"""
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def headers(self, access_token=None, extra=None):
+        headers = {"Content-Type": "application/json"}
+        if access_token:
+            headers["Authorization"] = f"Bearer {access_token}"
+        if extra:
+            headers.update(extra)
+        return headers
+
+    def request(self, method, path, access_token=None, headers=None, priority=INTERACTIVE, **kwargs):
+        """Send a request through the pooled session, retrying 429s and transient 5xx errors"""
+        kwargs.setdefault('timeout', self.timeout)
+        url = self.url(path)
+        headers = self.headers(access_token, headers)
+        attempt = 0
+        while True:
+            self.scheduler.acquire(priority)
+            with self._lock:
+                self._requests += 1
+            response = self.session.request(method, url, headers=headers, **kwargs)
+            if not self.scheduler.should_retry(response.status_code, attempt, response.headers.get('Retry-After')):
+                return response
+            time.sleep(self.scheduler.retry_delay(attempt, response.status_code, response.headers.get('Retry-After')))
+            attempt += 1
+
+    def get(self, path, access_token=None, params=None, cache=False, projection=None, **kwargs):
+        """GET a resource.
+
+        With `cache=True` the response goes through the ETag response cache. A
+        `projection` narrows the request to the fields the caller needs and
+        records the payload size of every response that came from the network.
+        """
+        request_params = projection.params(params) if projection else params
+        if cache:
+            response = self._get_cached(path, access_token, request_params, **kwargs)
+        else:
+            response = self.request('GET', path, access_token, params=request_params, **kwargs)
+
+        if projection and response.status_code == 200 and not getattr(response, 'from_cache', False):
+            payload_stats = get_payload_stats()
+            unprojected_bytes = None
+            if payload_stats.wants_unprojected(projection):
+                unprojected = self.request('GET', path, access_token, params=params, **kwargs)
+                if unprojected.status_code == 200:
+                    unprojected_bytes = len(unprojected.content)
+            payload_stats.record(projection, response, unprojected_bytes)
+        return response
+
+    def _get_cached(self, path, access_token, params, **kwargs):
+        response_cache = get_response_cache()
+        key = make_key(self.url(path), params)
+        entry = response_cache.get(key)
+        if entry and response_cache.is_fresh(entry):
+            return cached_response(entry, key)
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        response = self.request('GET', path, access_token, params=params, headers=headers, **kwargs)
+        if response.status_code == 304 and entry:
+            return cached_response(response_cache.revalidated(key, entry), key)
+        if response.status_code == 200:
+            response_cache.put(key, response.content, response.headers.get('ETag'))
+        return response
+
+    def post(self, path, access_token=None, data=None, **kwargs):
+        return self.request('POST', path, access_token, data=data, **kwargs)
+
+    def connection_stats(self):
+        """Return request and TCP connection counts, to measure connection reuse"""
+        connections = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+        requests_sent = self._requests
+        return {
+            'requests': requests_sent,
+            'connections': connections,
+            'reused': max(requests_sent - connections, 0)
+        }
+
+    def close(self):
+        self.session.close()
+
+def cached_response(entry, url):
+    """Build a 200 response from a cached body"""
+    response = requests.Response()
+    response.status_code = 200
+    response._content = entry['body']
+    response.url = url
+    response.encoding = 'utf-8'
+    response.from_cache = True
+    if entry['etag']:
+        response.headers['ETag'] = entry['etag']
+    return response
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Get the process-wide shared Spotify client"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = SpotifyClient()
+    return _client
+
+class AsyncSpotifyClient:
+    """Async counterpart of SpotifyClient for use inside an event loop"""
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, base_url=BASE_URL, scheduler=None):
+        self.base_url = base_url.rstrip('/')
+        self.scheduler = scheduler or get_scheduler()
+        self.pool_size = pool_size
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+        )
+        self._requests = 0
+
+    url = SpotifyClient.url
+    headers = SpotifyClient.headers
+
+    async def request(self, method, path, access_token=None, headers=None, priority=INTERACTIVE, **kwargs):
+        url = self.url(path)
+        headers = self.headers(access_token, headers)
+        attempt = 0
+        while True:
+            await self.scheduler.acquire_async(priority)
+            self._requests += 1
+            response = await self.client.request(method, url, headers=headers, **kwargs)
+            if not self.scheduler.should_retry(response.status_code, attempt, response.headers.get('Retry-After')):
+                return response
+            await asyncio.sleep(self.scheduler.retry_delay(attempt, response.status_code, response.headers.get('Retry-After')))
+            attempt += 1
+
+    async def get(self, path, access_token=None, params=None, projection=None, **kwargs):
+        request_params = projection.params(params) if projection else params
+        response = await self.request('GET', path, access_token, params=request_params, **kwargs)
+        if projection and response.status_code == 200:
+            payload_stats = get_payload_stats()
+            unprojected_bytes = None
+            if payload_stats.wants_unprojected(projection):
+                unprojected = await self.request('GET', path, access_token, params=params, **kwargs)
+                if unprojected.status_code == 200:
+                    unprojected_bytes = len(unprojected.content)
+            payload_stats.record(projection, response, unprojected_bytes)
+        return response
+
+    async def post(self, path, access_token=None, data=None, **kwargs):
+        return await self.request('POST', path, access_token, data=data, **kwargs)
+
+    def connection_stats(self):
+        """Return the request count and the connections currently open in the httpx pool"""
+        pool = getattr(getattr(self.client, '_transport', None), '_pool', None)
+        return {
+            'requests': self._requests,
+            'open_connections': len(getattr(pool, 'connections', None) or ())
+        }
+
+    async def close(self):
+        await self.client.aclose()
+
+_async_client = None
+
+def get_async_client():
+    """Get the shared async Spotify client, creating it on first use inside the running loop"""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncSpotifyClient()
+    return _async_client
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
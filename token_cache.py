@@ -0,0 +1,118 @@
+import asyncio
+import base64
+import hashlib
+import threading
+import time
+from decouple import config
+from spotify_client import TOKEN_URL, get_client
+
+REFRESH_MARGIN = config('SPOTIFY_TOKEN_REFRESH_MARGIN', default=60, cast=int)
+
+def hash_secret(client_secret):
+    return hashlib.sha256(client_secret.encode('utf-8')).hexdigest()
+
+class TokenCache:
+    """Client-credentials token cache keyed by client_id.
+
+    Only a hash of the client secret is kept, to check that a cached token
+    belongs to the credentials being presented. Tokens are refreshed
+    `refresh_margin` seconds before they expire, and a single thread per
+    client_id performs the refresh while the others keep using the old token.
+    """
+
+    def __init__(self, refresh_margin=REFRESH_MARGIN):
+        self.refresh_margin = refresh_margin
+        self._entries = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.fetches = 0
+
+    def _key_lock(self, client_id):
+        with self._lock:
+            if client_id not in self._locks:
+                self._locks[client_id] = threading.Lock()
+            return self._locks[client_id]
+
+    def _lookup(self, client_id, secret_hash, margin):
+        entry = self._entries.get(client_id)
+        if entry and entry['secret_hash'] == secret_hash and time.time() < entry['expires_at'] - margin:
+            return entry['access_token']
+        return None
+
+    def get_token(self, client_id, client_secret):
+        """Return (access_token, error) for the given credentials"""
+        secret_hash = hash_secret(client_secret)
+        token = self._lookup(client_id, secret_hash, self.refresh_margin)
+        if token:
+            self.hits += 1
+            return token, None
+
+        key_lock = self._key_lock(client_id)
+        if not key_lock.acquire(blocking=False):
+            # Another thread is refreshing; keep serving the old token while it is still valid
+            token = self._lookup(client_id, secret_hash, 0)
+            if token:
+                self.hits += 1
+                return token, None
+            key_lock.acquire()
+        try:
+            token = self._lookup(client_id, secret_hash, self.refresh_margin)
+            if token:
+                self.hits += 1
+                return token, None
+            return self._fetch(client_id, client_secret, secret_hash)
+        finally:
+            key_lock.release()
+
+    async def get_token_async(self, client_id, client_secret):
+        """Like get_token, but a refresh runs in a worker thread instead of blocking the event loop"""
+        token = self._lookup(client_id, hash_secret(client_secret), self.refresh_margin)
+        if token:
+            self.hits += 1
+            return token, None
+        return await asyncio.to_thread(self.get_token, client_id, client_secret)
+
+    def _fetch(self, client_id, client_secret, secret_hash):
+        self.fetches += 1
+        auth_header = base64.b64encode(
+            f"{client_id}:{client_secret}".encode('utf-8')
+        ).decode('utf-8')
+        try:
+            response = get_client().post(
+                TOKEN_URL,
+                headers={
+                    'Authorization': f'Basic {auth_header}',
+                    'Content-Type': 'application/x-www-form-urlencoded'
+                },
+                data={'grant_type': 'client_credentials'}
+            )
+        except Exception as e:
+            return None, f"Failed to get access token: {str(e)}"
+
+        if response.status_code != 200:
+            return None, "Invalid Spotify credentials"
+
+        auth_data = response.json()
+        self._entries[client_id] = {
+            'secret_hash': secret_hash,
+            'access_token': auth_data['access_token'],
+            'expires_at': time.time() + auth_data.get('expires_in', 3600)
+        }
+        return auth_data['access_token'], None
+
+    def invalidate(self, client_id):
+        """Drop the cached token for a client_id, e.g. after Spotify rejects it"""
+        self._entries.pop(client_id, None)
+
+_cache = TokenCache()
+
+def get_token_cache():
+    return _cache
+
+def get_cached_token(client_id, client_secret):
+    """Get a client-credentials access token, reusing a cached one while it is valid"""
+    return _cache.get_token(client_id, client_secret)
+
+async def get_cached_token_async(client_id, client_secret):
+    return await _cache.get_token_async(client_id, client_secret)
@@ -0,0 +1,138 @@
+import threading
+from decouple import config
+from models import artist_names
+from retry_policy import PERMANENT, DownloadFailed
+from search_cache import normalize
+from ydl_pool import get_ydl_pool
+
+MATCH_CANDIDATES = config('MATCH_CANDIDATES', default=5, cast=int)
+MATCH_THRESHOLD = config('MATCH_THRESHOLD', default=0.6, cast=float)
+# Candidates within this many seconds of the Spotify duration get the full duration score
+MATCH_DURATION_TOLERANCE = config('MATCH_DURATION_TOLERANCE', default=7, cast=int)
+# Flat search results carry no file size, so bytes are estimated from duration at this bitrate
+MATCH_ESTIMATED_KBPS = config('MATCH_ESTIMATED_KBPS', default=128, cast=int)
+
+# Versions that are rarely what a Spotify track is, unless its own title says so
+UNWANTED_VERSIONS = ('live', 'cover', 'remix', 'karaoke', 'instrumental', 'nightcore', 'sped up', 'slowed',
+                     'reverb', '8d', 'reaction', 'lyrics video', 'full album')
+
+DURATION_WEIGHT = 0.5
+TITLE_WEIGHT = 0.3
+ARTIST_WEIGHT = 0.2
+VERSION_PENALTY = 0.25
+
+# Search results are listed without resolving formats, which takes one request instead of one per video
+SEARCH_OPTS = {
+    'extract_flat': 'in_playlist',
+    'noplaylist': True,
+    'quiet': True,
+    'no_warnings': True,
+    'skip_download': True
+}
+
+def search_query(track_info):
+    return f"{' '.join(artist_names(track_info))} {track_info['name']} audio"
+
+def duration_score(duration_ms, duration):
+    """1.0 within the tolerance, falling to 0 one minute beyond it; 0.5 when a duration is unknown"""
+    if not duration_ms or not duration:
+        return 0.5
+    difference = abs(duration_ms / 1000 - duration)
+    if difference <= MATCH_DURATION_TOLERANCE:
+        return 1.0
+    return max(0.0, 1.0 - (difference - MATCH_DURATION_TOLERANCE) / 60)
+
+def word_coverage(words, text):
+    """Fraction of `words` found in `text`"""
+    words = normalize(words).split()
+    if not words:
+        return 1.0
+    found = set(normalize(text).split())
+    return sum(1 for word in words if word in found) / len(words)
+
+def score_candidate(track_info, candidate):
+    """Score a search result from 0 to 1 against a Spotify track"""
+    title = candidate.get('title') or ''
+    channel = candidate.get('channel') or candidate.get('uploader') or ''
+    artists = artist_names(track_info)
+
+    score = DURATION_WEIGHT * duration_score(track_info.get('duration_ms'), candidate.get('duration'))
+    score += TITLE_WEIGHT * word_coverage(track_info['name'], title)
+    if artists:
+        score += ARTIST_WEIGHT * sum(word_coverage(artist, f"{title} {channel}") for artist in artists) / len(artists)
+
+    wanted = f" {normalize(track_info['name'])} "
+    found = f" {normalize(title)} "
+    for version in UNWANTED_VERSIONS:
+        if f" {version} " in found and f" {version} " not in wanted:
+            score -= VERSION_PENALTY
+    return max(0.0, score)
+
+def select_best(track_info, candidates, threshold=MATCH_THRESHOLD):
+    """Return (best candidate, its score); the candidate is None when none reaches `threshold`"""
+    best, best_score = None, 0.0
+    for candidate in candidates:
+        score = score_candidate(track_info, candidate)
+        if score > best_score:
+            best, best_score = candidate, score
+    if best_score < threshold:
+        return None, best_score
+    return best, best_score
+
+def estimated_bytes(candidate):
+    if not candidate:
+        return 0
+    if candidate.get('filesize') or candidate.get('filesize_approx'):
+        return candidate.get('filesize') or candidate.get('filesize_approx')
+    return int((candidate.get('duration') or 0) * MATCH_ESTIMATED_KBPS * 1000 / 8)
+
+class MatchStats:
+    """Counts how often the first search hit was rejected and what downloading it would have cost"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {'searches': 0, 'matched': 0, 'no_match': 0, 'first_hit_rejected': 0,
+                       'bytes_saved_estimate': 0}
+
+    def record(self, candidates, chosen):
+        first = candidates[0] if candidates else None
+        with self._lock:
+            self._stats['searches'] += 1
+            self._stats['matched' if chosen else 'no_match'] += 1
+            if first is not None and first is not chosen:
+                # The old downloader would have fetched the first hit and thrown it away
+                self._stats['first_hit_rejected'] += 1
+                self._stats['bytes_saved_estimate'] += estimated_bytes(first)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def summary(self):
+        stats = self.stats()
+        return (f"{stats['matched']} of {stats['searches']} searches matched, "
+                f"first hit rejected {stats['first_hit_rejected']} time(s) "
+                f"(~{stats['bytes_saved_estimate'] / 1024 ** 2:.1f} MB not downloaded)")
+
+_stats = MatchStats()
+
+def get_match_stats():
+    return _stats
+
+def search_candidates(track_info, count=MATCH_CANDIDATES):
+    """List up to `count` search results with their title, channel and duration, without downloading"""
+    with get_ydl_pool().borrow('search', SEARCH_OPTS) as ydl:
+        results = ydl.extract_info(f"ytsearch{count}:{search_query(track_info)}", download=False)
+    return [entry for entry in (results or {}).get('entries') or [] if entry and entry.get('id')]
+
+def find_match(track_info, count=MATCH_CANDIDATES, threshold=MATCH_THRESHOLD):
+    """Return the id of the best matching video, or raise DownloadFailed if no candidate is close enough"""
+    candidates = search_candidates(track_info, count)
+    best, score = select_best(track_info, candidates, threshold)
+    _stats.record(candidates, best)
+    if best is None:
+        raise DownloadFailed(
+            f"No video matched {track_info['name']} (best score {score:.2f} of {len(candidates)} candidates)",
+            PERMANENT
+        )
+    return best['id']
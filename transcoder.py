@@ -0,0 +1,206 @@
+"""Post-processing of downloaded audio with ffmpeg.
+
+Download workers hand finished files to a Transcoder, which converts them on
+a fixed number of ffmpeg processes while the workers go back to downloading.
+The hand-off queue is bounded: when encoding falls behind, `submit` blocks the
+download workers instead of letting unprocessed files pile up on disk.
+"""
+import atexit
+import os
+import queue
+import subprocess
+import threading
+import time
+from concurrent.futures import Future
+from decouple import config
+
+# 'none' keeps the file yt-dlp downloaded; 'copy' remuxes the audio stream without re-encoding
+TRANSCODE_CODEC = config('TRANSCODE_CODEC', default='mp3')
+TRANSCODE_BITRATE = config('TRANSCODE_BITRATE', default='192k')
+TRANSCODE_LOUDNORM = config('TRANSCODE_LOUDNORM', default=False, cast=bool)
+TRANSCODE_WORKERS = config('TRANSCODE_WORKERS', default=os.cpu_count() or 2, cast=int)
+TRANSCODE_QUEUE_SIZE = config('TRANSCODE_QUEUE_SIZE', default=8, cast=int)
+FFMPEG_PATH = config('FFMPEG_PATH', default='ffmpeg')
+# EBU R128 single-pass loudness normalization, to the level streaming services play at
+LOUDNORM_FILTER = 'loudnorm=I=-14:TP=-1.5:LRA=11'
+
+# codec name -> (ffmpeg encoder, file extension)
+CODECS = {
+    'mp3': ('libmp3lame', '.mp3'),
+    'aac': ('aac', '.m4a'),
+    'opus': ('libopus', '.opus'),
+    'flac': ('flac', '.flac'),
+}
+# Containers that can hold a copied stream of each source extension
+COPY_EXTENSIONS = {'.webm': '.opus', '.m4a': '.m4a', '.mp4': '.m4a', '.mp3': '.mp3', '.ogg': '.ogg', '.opus': '.opus'}
+
+class TranscodeError(Exception):
+    pass
+
+class StageStats:
+    """Total time and count per pipeline stage, such as download, queue_wait and transcode"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def record(self, stage, seconds):
+        with self._lock:
+            count, total = self._stages.get(stage, (0, 0.0))
+            self._stages[stage] = (count + 1, total + seconds)
+
+    def stats(self):
+        with self._lock:
+            return {
+                stage: {'count': count, 'total': total, 'average': total / count}
+                for stage, (count, total) in self._stages.items()
+            }
+
+    def summary(self):
+        return stage_summary(self.stats())
+
+def stage_summary(stats):
+    """One-line summary of `StageStats.stats()`, also of stats published by another process"""
+    return ", ".join(
+        f"{stage} {values['total']:.1f}s ({values['average']:.2f}s avg)"
+        for stage, values in stats.items()
+    ) or "nothing recorded"
+
+_stage_stats = StageStats()
+
+def get_stage_stats():
+    return _stage_stats
+
+def output_path(source, codec):
+    """Path of the file `source` becomes under `codec`"""
+    root, extension = os.path.splitext(source)
+    if codec == 'copy':
+        return root + COPY_EXTENSIONS.get(extension.lower(), extension)
+    return root + CODECS[codec][1]
+
+def ffmpeg_command(source, destination, codec, bitrate, loudnorm):
+    command = [FFMPEG_PATH, '-hide_banner', '-nostdin', '-loglevel', 'error', '-y', '-i', source, '-vn']
+    if codec == 'copy':
+        command += ['-c:a', 'copy']
+    else:
+        if loudnorm:
+            command += ['-af', LOUDNORM_FILTER]
+        command += ['-c:a', CODECS[codec][0]]
+        if codec != 'flac':
+            command += ['-b:a', bitrate]
+    return command + [destination]
+
+class Transcoder:
+    """Bounded queue of files feeding `workers` concurrent ffmpeg processes.
+
+    The ffmpeg processes do the CPU work; each worker thread only starts one
+    and waits for it. `submit` returns a Future for the final path and removes
+    the source file once it has been converted.
+    """
+
+    def __init__(self, codec=TRANSCODE_CODEC, bitrate=TRANSCODE_BITRATE, loudnorm=TRANSCODE_LOUDNORM,
+                 workers=TRANSCODE_WORKERS, queue_size=TRANSCODE_QUEUE_SIZE, stats=None):
+        if codec not in CODECS and codec not in ('copy', 'none'):
+            raise ValueError(f"Unknown codec {codec!r}, expected one of {', '.join(list(CODECS) + ['copy', 'none'])}")
+        self.codec = codec
+        self.bitrate = bitrate
+        # Filters need decoded audio, so loudness normalization is not possible when copying the stream
+        self.loudnorm = loudnorm and codec in CODECS
+        self.workers = workers
+        self.stats = stats or get_stage_stats()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [
+                threading.Thread(target=self._run, daemon=True, name=f'transcode-{i}')
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def needs_work(self, source):
+        if self.codec == 'none':
+            return False
+        return self.loudnorm or output_path(source, self.codec) != source
+
+    def submit(self, source):
+        """Queue `source` for conversion, blocking while the queue is full; returns a Future of the final path"""
+        future = Future()
+        if not self.needs_work(source):
+            future.set_result(source)
+            return future
+        self._start()
+        self._queue.put((source, future, time.perf_counter()))
+        return future
+
+    def transcode(self, source):
+        """Convert `source` on the calling thread and return the final path"""
+        if not self.needs_work(source):
+            return source
+        destination = output_path(source, self.codec)
+        root, extension = os.path.splitext(destination)
+        # Write next to the target and swap it in, so a crash never leaves a truncated file under the final name
+        temporary = f"{root}.transcoding{extension}"
+        start = time.perf_counter()
+        try:
+            result = subprocess.run(
+                ffmpeg_command(source, temporary, self.codec, self.bitrate, self.loudnorm),
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=600
+            )
+        except FileNotFoundError:
+            raise TranscodeError(f"ffmpeg not found at {FFMPEG_PATH!r}; install it or set TRANSCODE_CODEC=none")
+        except subprocess.TimeoutExpired:
+            self._remove(temporary)
+            raise TranscodeError(f"ffmpeg timed out converting {source}")
+        if result.returncode != 0:
+            self._remove(temporary)
+            message = result.stderr.decode('utf-8', errors='ignore').strip().splitlines()
+            raise TranscodeError(f"ffmpeg failed on {source}: {message[-1] if message else result.returncode}")
+        os.replace(temporary, destination)
+        if os.path.abspath(source) != os.path.abspath(destination):
+            self._remove(source)
+        self.stats.record('transcode', time.perf_counter() - start)
+        return destination
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _run(self):
+        while True:
+            source, future, queued_at = self._queue.get()
+            try:
+                self.stats.record('queue_wait', time.perf_counter() - queued_at)
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(self.transcode(source))
+                    except Exception as e:
+                        future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def join(self):
+        """Wait until every queued file has been processed"""
+        self._queue.join()
+
+_transcoder = None
+_transcoder_lock = threading.Lock()
+
+def get_transcoder():
+    global _transcoder
+    if _transcoder is None:
+        with _transcoder_lock:
+            if _transcoder is None:
+                _transcoder = Transcoder()
+                atexit.register(_transcoder.join)
+    return _transcoder
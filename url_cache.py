@@ -0,0 +1,133 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from decouple import config
+
+STREAM_URL_CACHE_ENTRIES = config('STREAM_URL_CACHE_ENTRIES', default=10000, cast=int)
+# Lifetime assumed for URLs that don't say when they expire
+STREAM_URL_DEFAULT_TTL = config('STREAM_URL_DEFAULT_TTL', default=3600, cast=int)
+# A URL this close to expiry is no longer handed out, so clients have time to use it
+STREAM_URL_EXPIRY_MARGIN = config('STREAM_URL_EXPIRY_MARGIN', default=120, cast=int)
+# Hot URLs are re-resolved in the background once they are within this many seconds of expiry
+STREAM_URL_REFRESH_BEFORE = config('STREAM_URL_REFRESH_BEFORE', default=1800, cast=int)
+STREAM_URL_HOT_HITS = config('STREAM_URL_HOT_HITS', default=3, cast=int)
+
+# googlevideo URLs carry their expiry as ?expire=<unix time>, or /expire/<unix time>/ in manifest URLs
+EXPIRE_PATTERN = re.compile(r'[?&/]expire[=/](\d+)')
+
+def parse_expiry(url, default_ttl=STREAM_URL_DEFAULT_TTL):
+    """Unix time at which a stream URL stops working"""
+    match = EXPIRE_PATTERN.search(url)
+    if match:
+        return int(match.group(1))
+    return time.time() + default_ttl
+
+class StreamUrlCache:
+    """In-memory LRU of resolved stream URLs, keyed by (track id, format policy).
+
+    Entries live until the expiry encoded in the URL, less `expiry_margin`.
+    A hit on a URL that has been hit at least `hot_hits` times and is within
+    `refresh_before` seconds of expiry re-resolves it on `executor` with
+    `resolve(track_info)`, so popular tracks never fall back to a slow miss.
+    """
+
+    def __init__(self, resolve=None, executor=None, max_entries=STREAM_URL_CACHE_ENTRIES,
+                 expiry_margin=STREAM_URL_EXPIRY_MARGIN, refresh_before=STREAM_URL_REFRESH_BEFORE,
+                 hot_hits=STREAM_URL_HOT_HITS):
+        self.resolve = resolve
+        self.executor = executor
+        self.max_entries = max_entries
+        self.expiry_margin = expiry_margin
+        self.refresh_before = refresh_before
+        self.hot_hits = hot_hits
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'stored': 0, 'evictions': 0,
+                       'refreshes': 0, 'refresh_failures': 0}
+
+    def get(self, key):
+        """Return the cached URL for `key`, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if now >= entry['expires_at'] - self.expiry_margin:
+                del self._entries[key]
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            entry['hits'] += 1
+            self._stats['hits'] += 1
+            refresh = (
+                self.resolve is not None
+                and entry['hits'] >= self.hot_hits
+                and entry['expires_at'] - now < self.refresh_before
+                and key not in self._refreshing
+            )
+            if refresh:
+                self._refreshing.add(key)
+            url = entry['url']
+            track_info = entry['track_info']
+        if refresh:
+            self._schedule_refresh(key, track_info)
+        return url
+
+    def put(self, key, url, track_info=None, hits=0):
+        with self._lock:
+            self._entries[key] = {
+                'url': url,
+                'expires_at': parse_expiry(url),
+                'track_info': track_info,
+                'hits': hits
+            }
+            self._entries.move_to_end(key)
+            self._stats['stored'] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _schedule_refresh(self, key, track_info):
+        try:
+            if self.executor is not None:
+                self.executor.submit(self._refresh, key, track_info)
+            else:
+                threading.Thread(target=self._refresh, args=(key, track_info), daemon=True).start()
+        except RuntimeError:
+            # The executor is shutting down
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _refresh(self, key, track_info):
+        try:
+            url = self.resolve(track_info)
+            with self._lock:
+                entry = self._entries.get(key)
+                hits = entry['hits'] if entry else 0
+            if url:
+                # Keep the hit count, so the track stays hot across refreshes
+                self.put(key, url, track_info, hits=hits)
+            with self._lock:
+                self._stats['refreshes' if url else 'refresh_failures'] += 1
+        except Exception:
+            with self._lock:
+                self._stats['refresh_failures'] += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
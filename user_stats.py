@@ -1,5 +1,4 @@
 import streamlit as st
-import requests
 import plotly.express as px
 import plotly.graph_objects as go
 from collections import Counter
@@ -7,6 +6,7 @@ from decouple import config
 import base64
 import urllib.parse
 import pandas as pd
+from spotify_client import TOKEN_URL, get_client
 
 def get_auth_url():
     """Generate the authorization URL"""
@@ -36,8 +36,8 @@ def get_token_with_auth_code(code):
         ).decode('utf-8')
         
         # Exchange code for token
-        response = requests.post(
-            'https://accounts.spotify.com/api/token',
+        response = get_client().post(
+            TOKEN_URL,
             headers={
                 'Authorization': f'Basic {auth_header}',
                 'Content-Type': 'application/x-www-form-urlencoded'
@@ -59,15 +59,10 @@ def get_token_with_auth_code(code):
 
 def get_user_top_items(access_token, item_type):
     """Get user's top tracks or artists"""
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    
     try:
-        response = requests.get(
-            f"https://api.spotify.com/v1/me/top/{item_type}",
-            headers=headers,
+        response = get_client().get(
+            f"me/top/{item_type}",
+            access_token,
             params={'limit': 50, 'offset': 0}
         )
         
@@ -82,15 +77,10 @@ def get_user_top_items(access_token, item_type):
 
 def get_new_releases(access_token, limit=50):
     """Get new releases"""
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    
     try:
-        response = requests.get(
-            "https://api.spotify.com/v1/browse/new-releases",
-            headers=headers,
+        response = get_client().get(
+            "browse/new-releases",
+            access_token,
             params={'limit': limit, 'offset': 0, 'country': 'US'}
         )
         
@@ -105,15 +95,10 @@ def get_new_releases(access_token, limit=50):
 
 def get_featured_playlists(access_token, limit=50):
     """Get featured playlists"""
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    
     try:
-        response = requests.get(
-            "https://api.spotify.com/v1/browse/featured-playlists",
-            headers=headers,
+        response = get_client().get(
+            "browse/featured-playlists",
+            access_token,
             params={
                 'limit': limit, 
                 'offset': 0,
@@ -0,0 +1,89 @@
+import atexit
+import threading
+import weakref
+from contextlib import contextmanager
+import yt_dlp
+
+class YoutubeDLPool:
+    """Long-lived yt_dlp.YoutubeDL instances, one per thread and option profile.
+
+    Building a YoutubeDL sets up extractors and an HTTP session, so reusing one
+    per worker thread saves that work on every track. Options that differ per
+    call (such as the output template) are applied for the duration of the call
+    and then restored. An instance that raised is dropped and rebuilt on next use.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._instances = weakref.WeakSet()
+        self.created = 0
+        self.reused = 0
+
+    def _get(self, profile, base_opts):
+        instances = getattr(self._local, 'instances', None)
+        if instances is None:
+            instances = self._local.instances = {}
+        ydl = instances.get(profile)
+        if ydl is None:
+            ydl = yt_dlp.YoutubeDL(dict(base_opts))
+            instances[profile] = ydl
+            with self._lock:
+                self._instances.add(ydl)
+                self.created += 1
+        else:
+            with self._lock:
+                self.reused += 1
+        return ydl
+
+    def _discard(self, profile):
+        instances = getattr(self._local, 'instances', {})
+        ydl = instances.pop(profile, None)
+        if ydl is not None:
+            try:
+                ydl.close()
+            except Exception:
+                pass
+
+    @contextmanager
+    def borrow(self, profile, base_opts, **overrides):
+        """Use this thread's YoutubeDL for `profile`, with per-call option overrides"""
+        ydl = self._get(profile, base_opts)
+        saved = {}
+        for key, value in overrides.items():
+            saved[key] = ydl.params.get(key)
+            if key == 'outtmpl' and isinstance(value, str):
+                # YoutubeDL keeps output templates as {type: template}
+                value = {'default': value}
+            ydl.params[key] = value
+        try:
+            yield ydl
+        except Exception:
+            self._discard(profile)
+            raise
+        else:
+            for key, value in saved.items():
+                if value is None:
+                    ydl.params.pop(key, None)
+                else:
+                    ydl.params[key] = value
+
+    def stats(self):
+        with self._lock:
+            return {'created': self.created, 'reused': self.reused}
+
+    def close_all(self):
+        with self._lock:
+            instances = list(self._instances)
+            self._instances = weakref.WeakSet()
+        for ydl in instances:
+            try:
+                ydl.close()
+            except Exception:
+                pass
+
+_pool = YoutubeDLPool()
+atexit.register(_pool.close_all)
+
+def get_ydl_pool():
+    return _pool
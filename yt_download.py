@@ -2,9 +2,20 @@ import yt_dlp
 import os
 import random
 import time
-from pathlib import Path
 import streamlit as st
-import json
+import threading
+from concurrent.futures import Future
+from bandwidth import DOWNLOAD_FRAGMENT_CONCURRENCY, format_rate, get_bandwidth_limiter
+from download_pool import run_pool
+from downloads_store import DownloadsStore
+from library_layout import downloaded_path, output_template
+from partials import resume_sizes
+from library_index import LibraryIndex
+from retry_policy import PERMANENT, TRANSIENT, DownloadFailed, RetryBudget, get_retry_policy
+from search_cache import first_entry, get_search_cache, video_url
+from track_matcher import find_match
+from transcoder import get_stage_stats, get_transcoder
+from ydl_pool import get_ydl_pool
 
 USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -41,9 +52,8 @@ class QuietLogger:
         pass
     
     def error(self, msg):
-        if isinstance(msg, bytes):
-            msg = msg.decode('utf-8', errors='ignore')
-        st.error(f"Download Error: {msg}")
+        # yt-dlp raises the same error afterwards; download_with_retry classifies and reports it
+        pass
 
 def create_download_dir():
     """Create a downloads directory in the current folder"""
@@ -51,152 +61,251 @@ def create_download_dir():
     os.makedirs(download_dir, exist_ok=True)
     return download_dir
 
-def download_with_retry(track_info, download_dir, max_retries=3):
-    artists = track_info['artists']
+# Options shared by every download; the output template and headers are set per call
+DOWNLOAD_OPTS = {
+    # Download the best audio stream as is; the transcoder converts it afterwards
+    'format': 'bestaudio/best',
+    'noplaylist': True,
+    'logger': QuietLogger(),
+    'no_warnings': True,
+    'quiet': True,
+    'nocheckcertificate': True,
+    'socket_timeout': 30,
+    'retries': 3,
+    'no_color': True,
+    # Download to <file>.part and resume it with a ranged request if the download was interrupted
+    'continuedl': True,
+    'nopart': False,
+    # Fetch DASH/HLS fragments in parallel; plain HTTP streams are unaffected
+    'concurrent_fragment_downloads': DOWNLOAD_FRAGMENT_CONCURRENCY,
+    # Throttles every download to the shared DOWNLOAD_BANDWIDTH_LIMIT and measures throughput
+    'progress_hooks': [get_bandwidth_limiter().progress_hook]
+}
+
+def download_with_retry(track_info, download_dir, max_retries=None, policy=None, budget=None):
+    """Download a track and return its file path, retrying as `policy` allows.
+
+    Raises DownloadFailed, carrying the class of the last error, once the
+    policy gives up. `budget` is the RetryBudget of the batch the track is in.
+    """
     track_name = track_info['name']
-    search_query = f"{' '.join(artists)} {track_name} audio"
+    search_cache = get_search_cache()
+    policy = policy or get_retry_policy()
+    attempt = 0
     
-    for attempt in range(max_retries):
+    while True:
+        attempt += 1
+        headers = get_random_headers()
+        output_path = output_template(track_info, download_dir)
+        # Partial files from an earlier attempt set the resume baseline, so only new bytes count against the cap
+        get_bandwidth_limiter().expect_resume(resume_sizes(track_info, download_dir))
+        # Reuse an earlier match for this track instead of searching again
+        video_id = search_cache.lookup(track_info)
+        matched_id = None
         try:
-            if attempt > 0:
-                time.sleep(random.uniform(2, 5))
-
-            headers = get_random_headers()
-            
-            # Create a filename based on track info
-            safe_filename = f"{track_name} - {', '.join(artists)}".replace('/', '_').replace('\\', '_')
-            output_template = os.path.join(download_dir, f"{safe_filename}.%(ext)s")
-
-            ydl_opts = {
-                'format': 'bestaudio[ext=mp3]/bestaudio[ext=m4a]/bestaudio',  # Prefer MP3 format directly
-                'outtmpl': output_template,
-                'noplaylist': True,
-                'logger': QuietLogger(),
-                'no_warnings': True,
-                'quiet': True,
-                'nocheckcertificate': True,
-                'http_headers': headers,
-                'socket_timeout': 30,
-                'retries': 3,
-                'ignoreerrors': True,
-                'no_color': True,
-                'extract_audio': True,
-                'prefer_ffmpeg': False  # Don't use ffmpeg
-            }
-
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                try:
-                    search_url = f"ytsearch1:{search_query}"
-                    info = ydl.extract_info(search_url, download=True)
-                    
-                    if info and 'entries' in info and info['entries']:
-                        # Find the downloaded file
-                        files = list(Path(download_dir).glob(f"{safe_filename}.*"))
-                        if files:
-                            # If the file isn't MP3, try to rename it
-                            if files[0].suffix.lower() != '.mp3':
-                                new_path = files[0].with_suffix('.mp3')
-                                os.rename(files[0], new_path)
-                                return str(new_path)
-                            return str(files[0])
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        raise Exception(f"Failed to download: {str(e)}")
-                    continue
-
-            time.sleep(random.uniform(1, 3))
-
+            # Compare several search results before downloading, so only the best match is fetched
+            matched_id = video_id or find_match(track_info)
+            if not video_id:
+                # Remember the match up front, so an interrupted download resumes the same video
+                search_cache.store(track_info, matched_id)
+            start = time.perf_counter()
+            with get_ydl_pool().borrow('download', DOWNLOAD_OPTS, outtmpl=output_path, http_headers=headers) as ydl:
+                info = ydl.extract_info(video_url(matched_id), download=True)
+            get_stage_stats().record('download', time.perf_counter() - start)
+            entry = first_entry(info)
+            if not entry:
+                raise DownloadFailed(f"No video found for {track_name}", PERMANENT)
+            # yt-dlp reports where it wrote the file, so there is no need to search for it
+            file_path = downloaded_path(entry)
+            if not file_path or not os.path.exists(file_path):
+                raise DownloadFailed(f"yt-dlp wrote no file for {track_name}", TRANSIENT)
+            return file_path
         except Exception as e:
-            if attempt == max_retries - 1:
-                raise Exception(f"All download attempts failed: {str(e)}")
+            error_class = policy.classify(e)
+            # Keep the match through transient errors so the partial file can be resumed
+            if matched_id and error_class == PERMANENT:
+                search_cache.invalidate(track_info)
+                # The cached video may be what's gone; a fresh search can still find the track
+                if video_id:
+                    error_class = TRANSIENT
+            delay = policy.next_delay(error_class, attempt, max_retries, budget)
+            if delay is None:
+                raise DownloadFailed(
+                    f"Failed to download after {attempt} attempt(s): {str(e)}", error_class,
+                    budget_exhausted=budget is not None and budget.exhausted()
+                ) from e
+            time.sleep(delay)
 
-    raise Exception("Download failed after all attempts")
+def postprocess(track_info, file_path):
+    """Queue a downloaded file for transcoding, then record it in the library.
+
+    Returns a Future of the final path. Blocks while the transcode queue is full.
+    """
+    result = Future()
+    
+    def done(future):
+        try:
+            final_path = future.result()
+            add_to_downloads(track_info, final_path)
+            result.set_result(final_path)
+        except Exception as e:
+            result.set_exception(e)
+    
+    get_transcoder().submit(file_path).add_done_callback(done)
+    return result
 
 def get_downloads_db_path():
     """Get the path to the downloads database file"""
+    return os.path.join(os.getcwd(), "download", "downloads.db")
+
+def get_legacy_downloads_db_path():
+    """Get the path of the JSON downloads database used by older versions"""
     return os.path.join(os.getcwd(), "download", "downloads.json")
 
+_stores = {}
+_indexes = {}
+_stores_lock = threading.Lock()
+
+def get_downloads_store():
+    """Get the downloads store for the current download directory, migrating downloads.json on first use"""
+    db_path = get_downloads_db_path()
+    with _stores_lock:
+        if db_path not in _stores:
+            _stores[db_path] = DownloadsStore(db_path, json_path=get_legacy_downloads_db_path())
+        return _stores[db_path]
+
 def load_downloads_db():
     """Load the downloads database"""
-    db_path = get_downloads_db_path()
-    if os.path.exists(db_path):
-        try:
-            with open(db_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return {'tracks': []}
-    return {'tracks': []}
+    return {'tracks': get_downloads_store().all()}
 
 def save_downloads_db(db):
     """Save the downloads database"""
-    db_path = get_downloads_db_path()
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    with open(db_path, 'w', encoding='utf-8') as f:
-        json.dump(db, f, indent=2, ensure_ascii=False)
+    get_downloads_store().replace_all(db['tracks'])
 
 def add_to_downloads(track_info, file_path):
     """Add a track to the downloads database"""
-    db = load_downloads_db()
-    track_entry = {
+    # Index the file first: a reconcile pruning between the two writes would otherwise drop the new record
+    get_library_index().add_file(file_path)
+    get_downloads_store().add({
+        'track_id': track_info.get('id'),
         'name': track_info['name'],
         'artists': track_info['artists'],
         'file_path': file_path,
         'downloaded_at': time.strftime('%Y-%m-%d %H:%M:%S'),
         'album': track_info.get('album', ''),
         'album_image': track_info.get('album_image', track_info.get('image_url', ''))
-    }
-    
-    # Check if track already exists
-    existing = next((t for t in db['tracks'] if t['file_path'] == file_path), None)
-    if not existing:
-        db['tracks'].append(track_entry)
-        save_downloads_db(db)
+    })
+
+def get_library_index():
+    """Get the filesystem index of the current download directory"""
+    db_path = get_downloads_db_path()
+    get_downloads_store()
+    with _stores_lock:
+        if db_path not in _indexes:
+            _indexes[db_path] = LibraryIndex(db_path, os.path.dirname(db_path))
+        return _indexes[db_path]
 
 def get_downloaded_tracks():
     """Get list of downloaded tracks"""
-    db = load_downloads_db()
-    # Filter out tracks whose files no longer exist
-    existing_tracks = [
-        track for track in db['tracks']
-        if os.path.exists(track['file_path'])
-    ]
-    # Update the database if some files were removed
-    if len(existing_tracks) != len(db['tracks']):
-        db['tracks'] = existing_tracks
-        save_downloads_db(db)
-    return existing_tracks
+    index = get_library_index()
+    # Missing files are pruned by the background reconcile, not on every render
+    if not index.is_built():
+        index.reconcile()
+    index.start()
+    return get_downloads_store().all()
+
+def find_downloaded(track_info):
+    """Return the path of an earlier download of this Spotify track if its file is intact, else None"""
+    track_id = track_info.get('id')
+    if not track_id:
+        return None
+    index = get_library_index()
+    for track in get_downloads_store().by_track_id(track_id):
+        try:
+            size = os.stat(track['file_path']).st_size
+        except OSError:
+            continue
+        indexed_size = index.file_size(track['file_path'])
+        if size > 0 and (indexed_size is None or indexed_size == size):
+            return track['file_path']
+    return None
+
+def preflight(tracks_info):
+    """Split tracks into (already downloaded [(track, path)], still to download [track])"""
+    downloaded = []
+    pending = []
+    for track in tracks_info:
+        file_path = find_downloaded(track)
+        if file_path:
+            downloaded.append((track, file_path))
+        else:
+            pending.append(track)
+    return downloaded, pending
 
 def download_track(track_info):
-    """Download a single track"""
+    """Download a single track, unless it is already downloaded"""
     try:
+        file_path = find_downloaded(track_info)
+        if file_path:
+            return file_path
         download_dir = create_download_dir()
         file_path = download_with_retry(track_info, download_dir)
-        if file_path:
-            add_to_downloads(track_info, file_path)
-        return file_path
+        return postprocess(track_info, file_path).result()
     except Exception as e:
         st.error(f"Failed to download track: {str(e)}")
         return None
 
-def download_tracks(tracks_info):
-    """Download multiple tracks"""
+def resolve(ok, value):
+    """Wait for the transcoded file of a successful download"""
+    if not ok:
+        return ok, value
+    try:
+        return True, value.result()
+    except Exception as e:
+        return False, str(e)
+
+def download_tracks(tracks_info, max_workers=None, on_progress=None):
+    """Download multiple tracks on a pool of workers.
+
+    Tracks that are already downloaded are skipped without searching. Results
+    come back in input order as (success, file path or error) tuples.
+    Progress is reported through `on_progress(done, total, track, ok)`, or a
+    Streamlit progress bar when no callback is given.
+    """
     download_dir = create_download_dir()
-    results = []
+    status_text = None
+    tracks_info = list(tracks_info)
+    downloaded, pending = preflight(tracks_info)
     
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    for i, track in enumerate(tracks_info):
-        try:
-            status_text.text(f"Downloading {i+1}/{len(tracks_info)}: {track['name']}")
-            file_path = download_with_retry(track, download_dir)
-            if file_path:
-                add_to_downloads(track, file_path)
-            results.append((True, file_path))
-        except Exception as e:
-            results.append((False, str(e)))
+    if on_progress is None:
+        progress_bar = st.progress(0)
+        status_text = st.empty()
         
-        progress_bar.progress((i + 1) / len(tracks_info))
+        def on_progress(done, total, track, ok):
+            throughput = format_rate(get_bandwidth_limiter().throughput())
+            status_text.text(f"Downloaded {done}/{total}: {track['name']} ({throughput})")
+            progress_bar.progress(done / total)
+    
+    budget = RetryBudget.for_batch(len(pending))
+    
+    def download(track):
+        # Hand the file to the transcoder and move on to the next download
+        file_path = download_with_retry(track, download_dir, budget=budget)
+        return postprocess(track, file_path)
+    
+    pending_results = iter([
+        resolve(ok, value)
+        for ok, value in run_pool(pending, download, max_workers=max_workers, on_progress=on_progress)
+    ])
+    skipped = {id(track): file_path for track, file_path in downloaded}
+    results = [
+        (True, skipped[id(track)]) if id(track) in skipped else next(pending_results)
+        for track in tracks_info
+    ]
     
-    status_text.text("Download completed!")
-    return results
\ No newline at end of file
+    if status_text is not None:
+        failed = sum(1 for ok, _ in results if not ok)
+        status_text.text(
+            f"Download completed! {len(pending) - failed} new, {len(downloaded)} skipped, {failed} failed"
+        )
+    return results
@@ -1,8 +1,18 @@
-import yt_dlp
+import asyncio
 import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import os
+from decouple import config
+from search_cache import first_entry, get_search_cache, video_url
+from track_matcher import find_match
+from url_cache import StreamUrlCache
+from ydl_pool import get_ydl_pool
+
+# yt-dlp extraction is blocking, so the API runs it on a bounded pool of threads
+YTDLP_MAX_WORKERS = config('YTDLP_MAX_WORKERS', default=4, cast=int)
+_executor = ThreadPoolExecutor(max_workers=YTDLP_MAX_WORKERS, thread_name_prefix='yt-dlp')
 
 USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -43,30 +53,37 @@ class QuietLogger:
             msg = msg.decode('utf-8', errors='ignore')
         print(f"Download Error: {msg}")
 
-def get_download_url(track_info):
-    """Get direct download URL for a track without downloading"""
+URL_OPTS = {
+    'format': 'bestaudio',
+    'noplaylist': True,
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': False,
+    'youtube_include_dash_manifest': False,
+    'logger': QuietLogger()
+}
+
+def resolve_download_url(track_info):
+    """Resolve the direct download URL for a track with yt-dlp, without downloading"""
     try:
-        # Extract artist names if they're objects
-        artists = [artist['name'] if isinstance(artist, dict) else artist for artist in track_info['artists']]
-        track_name = track_info['name']
-        search_query = f"{' '.join(artists)} {track_name} audio"
+        search_cache = get_search_cache()
+        video_id = search_cache.lookup(track_info)
         
-        ydl_opts = {
-            'format': 'bestaudio',
-            'noplaylist': True,
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-            'youtube_include_dash_manifest': False,
-            'logger': QuietLogger()
-        }
+        # Re-extract formats for a known match, or pick the best of several search results
+        matched_id = video_id or find_match(track_info)
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Search for the video
-            search_results = ydl.extract_info(f"ytsearch1:{search_query}", download=False)
+        with get_ydl_pool().borrow('url', URL_OPTS) as ydl:
+            try:
+                search_results = ydl.extract_info(video_url(matched_id), download=False)
+            except Exception:
+                if video_id:
+                    search_cache.invalidate(track_info)
+                raise
+            video_info = first_entry(search_results)
             
-            if search_results and 'entries' in search_results and search_results['entries']:
-                video_info = search_results['entries'][0]
+            if video_info:
+                if not video_id:
+                    search_cache.store(track_info, matched_id)
                 
                 # Get the URL directly from the best format
                 url = video_info.get('url')
@@ -93,4 +110,38 @@ def get_download_url(track_info):
         return None
     except Exception as e:
         print(f"Error getting download URL: {str(e)}")
-        return None 
\ No newline at end of file
+        return None
+
+_url_cache = StreamUrlCache(resolve=resolve_download_url, executor=_executor)
+
+def get_url_cache():
+    return _url_cache
+
+def url_cache_key(track_info):
+    """Cache key of a track's stream URL, or None if the track has no id"""
+    track_id = track_info.get('id')
+    return (track_id, URL_OPTS['format']) if track_id else None
+
+def get_download_url(track_info):
+    """Get direct download URL for a track, from the cache while the last one is still valid"""
+    key = url_cache_key(track_info)
+    url = _url_cache.get(key) if key else None
+    if url:
+        return url
+    url = resolve_download_url(track_info)
+    if url and key:
+        _url_cache.put(key, url, track_info)
+    return url
+
+async def get_download_url_async(track_info):
+    """Get the download URL, resolving it on the yt-dlp executor without blocking the event loop"""
+    key = url_cache_key(track_info)
+    # A cache hit is answered right here, without a hop to the executor
+    url = _url_cache.get(key) if key else None
+    if url:
+        return url
+    loop = asyncio.get_running_loop()
+    url = await loop.run_in_executor(_executor, resolve_download_url, track_info)
+    if url and key:
+        _url_cache.put(key, url, track_info)
+    return url